@@ -0,0 +1,628 @@
+"""
+Connection, query, loading and reporting helpers shared by the sample data
+generators, the integration test and the conversion scripts.
+"""
+
+import os
+import re
+import csv
+import json
+import atexit
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache, partial
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from databricks import sql
+
+_SECTION_RE = re.compile(r'^\[([^\]\n]+)\][ \t]*$', re.MULTILINE)
+_KEY_VALUE_RE = re.compile(r'^[ \t]*(host|token)[ \t]*[=:][ \t]*(.*?)[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+# Quoted literals/identifiers vs. everything else, for normalize_hql
+_NORMALIZE_TOKEN_RE = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)|([^'"`]+|['"`])""")
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# ANSI color codes
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    YELLOW = '\033[93m'
+    BLUE = '\033[94m'
+    CYAN = '\033[96m'
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+    BOLD = '\033[1m'
+
+
+# Smaller tables load faster as bound parameters than through an upload
+BULK_LOAD_MIN_ROWS = 100
+
+# Per-table status lines; GEN_VERBOSE=0 prints only errors and the final tally
+VERBOSE = os.getenv('GEN_VERBOSE', '1') == '1'
+
+# Table rows, one JSON file per table
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+# Column types that can't be bound or CAST from text; they are loaded as JSON
+COMPLEX_TYPES = ('ARRAY', 'STRUCT', 'MAP')
+
+# Serializes console output from concurrent statements
+_print_lock = threading.Lock()
+
+# Error classes a warehouse without BEGIN ATOMIC blocks rejects them with
+_NO_ATOMIC_BLOCK_ERRORS = ('PARSE_SYNTAX_ERROR', 'UNSUPPORTED_FEATURE')
+# Set once the warehouse has rejected a block, so later loads don't try again
+_no_atomic_blocks = threading.Event()
+
+
+def log(message: str = '') -> None:
+    """Print a message without interleaving with other threads' output."""
+    with _print_lock:
+        print(message)
+
+
+def report(action: str, table: str, row_count: int, error: Optional[Exception] = None):
+    """Print a table's load status; successes are only shown in verbose mode."""
+    if error is None and not VERBOSE:
+        return
+    status = f"  {Colors.YELLOW}▸ {action} {table} ({row_count} rows)...{Colors.RESET}"
+    if error is None:
+        log(f"{status} {Colors.GREEN}✓{Colors.RESET}")
+    else:
+        log(f"{status} {Colors.RED}✗ Error: {str(error)[:100]}{Colors.RESET}")
+
+
+class ThreadConnections:
+    """
+    Hands each thread its own connection, opening it on first use (the
+    connector's threadsafety level is 1: threads may not share a connection).
+    An already open connection can be lent to the first taker; its owner
+    closes it. Close the opened ones with close().
+    """
+    
+    def __init__(self, connect: Callable, connection=None):
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._idle = [connection] if connection else []
+        self._opened = []
+    
+    def get(self):
+        """Return the calling thread's connection, opening it on first use."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = self._connect()
+                with self._lock:
+                    self._opened.append(connection)
+            self._local.connection = connection
+        return connection
+    
+    def release(self, connections: list):
+        """Hand connections of threads that have finished to later takers."""
+        with self._lock:
+            self._idle.extend(connections)
+    
+    def close(self):
+        """Close every connection opened here."""
+        with self._lock:
+            for connection in self._opened:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            self._opened.clear()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CursorPool:
+    """
+    Runs independent statements concurrently on a thread pool. Each worker
+    thread reuses one cursor on its own connection from connections; leaving
+    the with block waits for every submitted statement, closes the cursors
+    and releases the connections for reuse.
+    """
+    
+    def __init__(self, connections: ThreadConnections, max_workers: int = 8):
+        self._connections = connections
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cursors = []
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    
+    def _cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._connections.get().cursor()
+            self._local.cursor = cursor
+            with self._lock:
+                self._cursors.append(cursor)
+        return cursor
+    
+    def submit(self, func, *args):
+        """Schedule func(cursor, *args) on a worker thread's cursor."""
+        future = self._executor.submit(lambda: func(self._cursor(), *args))
+        self._futures.append(future)
+        return future
+    
+    def results(self) -> list:
+        """Return every submitted call's result in submission order, waiting as needed."""
+        return [future.result() for future in self._futures]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for cursor in self._cursors:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            self._connections.release([cursor.connection for cursor in self._cursors])
+            self._cursors.clear()
+
+
+def normalize_hql(hql_query: str) -> str:
+    """
+    Reduce HQL to a canonical form for near-duplicate matching: whitespace is
+    collapsed and everything outside quoted literals/identifiers is lowercased
+    (Spark SQL keywords and identifiers are case-insensitive).
+    """
+    parts = []
+    for match in _NORMALIZE_TOKEN_RE.finditer(hql_query):
+        literal, text = match.group(1), match.group(2)
+        parts.append(literal if literal else _WHITESPACE_RE.sub(' ', text.lower()))
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def submit_query(cursor, query: str, parameters: Optional[Dict] = None) -> Optional[Exception]:
+    """
+    Start a query without waiting for it when the connector supports
+    execute_async (databricks-sql-connector >= 3.7), otherwise run it
+    synchronously. Returns the submission error, if any.
+    """
+    try:
+        if hasattr(cursor, 'execute_async'):
+            cursor.execute_async(query, parameters)
+        else:
+            cursor.execute(query, parameters)
+    except Exception as e:
+        return e
+    return None
+
+
+def collect_query(cursor) -> list:
+    """Wait for a query started with submit_query and fetch all its rows."""
+    if hasattr(cursor, 'execute_async'):
+        cursor.get_async_execution_result()
+    return cursor.fetchall()
+
+
+def _fixture_value(value, column_type: str):
+    """Convert a JSON fixture value to the Python type bound for its column."""
+    if value is None:
+        return None
+    if column_type == 'DATE':
+        return date.fromisoformat(value)
+    if column_type == 'TIMESTAMP':
+        return datetime.fromisoformat(value)
+    if column_type.startswith('DECIMAL'):
+        return Decimal(str(value))
+    if column_type.startswith(COMPLEX_TYPES):
+        return json.dumps(value)
+    return value
+
+
+def load_fixture(table: str) -> Tuple[List[Tuple[str, str]], List[tuple]]:
+    """
+    Read a table's columns and rows from FIXTURES_DIR/<table>.json. Dates and
+    timestamps are ISO strings there; they, decimals and nested values are
+    converted to what their columns bind as.
+    """
+    with open(FIXTURES_DIR / f'{table}.json', encoding='utf-8') as f:
+        fixture = json.load(f)
+    columns = [tuple(column) for column in fixture['columns']]
+    rows = [
+        tuple(_fixture_value(value, column_type) for value, (_, column_type) in zip(row, columns))
+        for row in fixture['rows']
+    ]
+    return columns, rows
+
+
+def column_expression(name: str, column_type: str) -> str:
+    """Select a loaded column as its type; complex types arrive as JSON text."""
+    if column_type.startswith(COMPLEX_TYPES):
+        return f"from_json({name}, '{column_type}') AS {name}"
+    return f"CAST({name} AS {column_type}) AS {name}"
+
+
+def insert_batches(table: str, columns: List[Tuple[str, str]], rows: List[tuple],
+                   rows_per_statement: int) -> List[Tuple[str, list]]:
+    """Build INSERTs binding rows as parameters, rows_per_statement rows each."""
+    statements = []
+    for start in range(0, len(rows), rows_per_statement):
+        batch = rows[start:start + rows_per_statement]
+        statement = f"INSERT INTO {table} {values_query(columns, len(batch))}"
+        statements.append((statement, list(chain.from_iterable(batch))))
+    return statements
+
+
+def values_query(columns: List[Tuple[str, str]], row_count: int) -> str:
+    """
+    Build a SELECT over a VALUES list of row_count placeholder rows, giving
+    each column its type.
+    """
+    names = ', '.join(name for name, _ in columns)
+    placeholders = '(' + ', '.join(['?'] * len(columns)) + ')'
+    select_list = ', '.join(column_expression(name, column_type) for name, column_type in columns)
+    return f"SELECT {select_list} FROM VALUES {', '.join([placeholders] * row_count)} AS v({names})"
+
+
+def fill_table(table: str, query: str, parameters: Optional[list] = None,
+               existing: Set[str] = frozenset()) -> List[Tuple[str, list]]:
+    """
+    Build the statements loading a query's rows into a table. A table that
+    already exists keeps its metadata and just has its rows replaced; otherwise
+    one CREATE TABLE ... AS SELECT both defines and loads it.
+    """
+    parameters = parameters or []
+    if table in existing:
+        return [(f"DELETE FROM {table}", []), (f"INSERT INTO {table} {query}", parameters)]
+    return [(f"CREATE TABLE {table} USING ICEBERG AS {query}", parameters)]
+
+
+def run_statements(cursor, statements: List[Tuple[str, list]], max_params: int = 256):
+    """
+    Run a table's load statements. Several statements are sent as one
+    BEGIN ATOMIC block so the table gets a single commit (and snapshot) instead
+    of one per statement, as long as their parameters together stay within the
+    per-statement cap of max_params; past it they run one by one. A warehouse
+    that doesn't support the block syntax gets the statements one by one, for
+    this and every later load; any other error is raised. A block is used
+    rather than BEGIN/COMMIT because it is a single statement: one round trip,
+    with nothing left open to roll back if it fails.
+    """
+    parameters = list(chain.from_iterable(params for _, params in statements))
+    if len(statements) > 1 and len(parameters) <= max_params and not _no_atomic_blocks.is_set():
+        block = 'BEGIN ATOMIC\n' + ''.join(f"  {statement};\n" for statement, _ in statements) + 'END'
+        try:
+            cursor.execute(block, parameters)
+            return
+        except Exception as e:
+            if not any(error_class in str(e) for error_class in _NO_ATOMIC_BLOCK_ERRORS):
+                raise
+            _no_atomic_blocks.set()
+    for statement, parameters in statements:
+        cursor.execute(statement, parameters or None)
+
+
+def stage_rows(cursor, table: str, names: List[str], rows: List[tuple],
+               staging_volume: str) -> str:
+    """
+    Write rows to a local CSV file and upload it to the staging volume with PUT.
+    Returns the file's path in the volume.
+    """
+    volume_path = f"{staging_volume.rstrip('/')}/{table}.csv"
+    with tempfile.NamedTemporaryFile('w', newline='', encoding='utf-8',
+                                     suffix='.csv', delete=False) as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(rows)
+    try:
+        cursor.execute(f"PUT '{f.name}' INTO '{volume_path}' OVERWRITE")
+    finally:
+        os.remove(f.name)
+    return volume_path
+
+
+def staged_query(columns: List[Tuple[str, str]], volume_path: str) -> str:
+    """Build a SELECT over a staged CSV file, giving each column its type."""
+    select_list = ', '.join(column_expression(name, column_type) for name, column_type in columns)
+    return (
+        f"SELECT {select_list} FROM read_files('{volume_path}', format => 'csv', "
+        f"header => true, escape => '\"', inferColumnTypes => false)"
+    )
+
+
+def load_table(cursor, table: str, columns: List[Tuple[str, str]], rows: List[tuple],
+               existing: Set[str] = frozenset(), staging_volume: Optional[str] = None,
+               max_params: int = 256):
+    """
+    Create or reload a table from rows, with feedback. With a staging volume,
+    tables of BULK_LOAD_MIN_ROWS or more are bulk loaded from a staged CSV file;
+    otherwise rows are passed as bound parameters, with rows past the
+    per-statement parameter cap following as INSERTs.
+    """
+    names = [name for name, _ in columns]
+    action = 'Reloading' if table in existing else 'Creating'
+    try:
+        if staging_volume and len(rows) >= BULK_LOAD_MIN_ROWS:
+            volume_path = stage_rows(cursor, table, names, rows, staging_volume)
+            statements = fill_table(table, staged_query(columns, volume_path), existing=existing)
+        else:
+            rows_per_statement = max(1, max_params // len(columns))
+            first_batch = rows[:rows_per_statement]
+            statements = fill_table(table, values_query(columns, len(first_batch)),
+                                    list(chain.from_iterable(first_batch)), existing)
+            statements += insert_batches(table, columns, rows[rows_per_statement:], rows_per_statement)
+        run_statements(cursor, statements, max_params)
+    except Exception as e:
+        report(action, table, len(rows), e)
+        return False
+    report(action, table, len(rows))
+    return True
+
+
+def existing_tables(connection) -> Set[str]:
+    """Return the names of the tables in the current schema."""
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW TABLES")
+        return {row[1] for row in cursor.fetchall()}
+
+
+@lru_cache(maxsize=64)
+def _drop_statements(tables: Tuple[str, ...], functions: Tuple[str, ...]) -> Tuple[Tuple[str, ...], str]:
+    """Return the DROP statements for tables and functions, and the script block running them all."""
+    drops = tuple(f"DROP TABLE IF EXISTS {table}" for table in tables)
+    drops += tuple(f"DROP FUNCTION IF EXISTS {function}" for function in functions)
+    return drops, 'BEGIN\n' + ''.join(f"  {drop};\n" for drop in drops) + 'END'
+
+
+def drop_tables(connection, tables: List[str], functions: List[str] = ()):
+    """
+    Drop tables (and functions) if they exist, ignoring errors. All DROPs are
+    sent as one SQL script block, a single round trip. A warehouse without SQL
+    scripting gets every DROP submitted on its own cursor before any is awaited
+    when the connector supports execute_async, which also costs about one
+    round trip. The statements for a given set of names are built once per process.
+    """
+    drops, script = _drop_statements(tuple(tables), tuple(functions))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(script)
+        return
+    except Exception:
+        pass
+    
+    cursors = [connection.cursor() for _ in drops]
+    pending = []
+    try:
+        for cursor, drop in zip(cursors, drops):
+            try:
+                if hasattr(cursor, 'execute_async'):
+                    cursor.execute_async(drop)
+                    pending.append(cursor)
+                else:
+                    cursor.execute(drop)
+            except Exception:
+                pass
+        
+        for cursor in pending:
+            try:
+                cursor.get_async_execution_result()
+            except Exception:
+                pass
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
+
+def _config_section(text: str, name: str) -> Optional[Dict[str, str]]:
+    """
+    Return the host/token entries of one INI section, keys lowercased (they
+    are case-insensitive, as with configparser), or None if it's absent.
+    """
+    for match in _SECTION_RE.finditer(text):
+        if match.group(1).strip() == name:
+            following = _SECTION_RE.search(text, match.end())
+            body = text[match.end():following.start() if following else len(text)]
+            return {key.lower(): value for key, value in _KEY_VALUE_RE.findall(body)}
+    return None
+
+
+def read_databricks_config(profile: str = 'DEFAULT') -> Tuple[str, str]:
+    """
+    Read Databricks configuration from .databrickscfg file.
+    DATABRICKS_HOST and DATABRICKS_TOKEN, when both are set, take precedence
+    and the file is not read at all.
+    """
+    host = os.getenv('DATABRICKS_HOST')
+    token = os.getenv('DATABRICKS_TOKEN')
+    if host and token:
+        return host.strip(), token.strip()
+    
+    return _read_profile(profile)
+
+
+@lru_cache(maxsize=4)
+def _read_profile(profile: str) -> Tuple[str, str]:
+    """
+    Read one profile's host and token from .databrickscfg. Only the profile's
+    own section (plus [DEFAULT] fallbacks) is scanned, and the result is
+    cached per profile for the life of the process.
+    """
+    config_path = Path.home() / '.databrickscfg'
+    text = config_path.read_text(encoding='utf-8')
+    section = _config_section(text, profile)
+    if section is None:
+        raise ValueError(f"Profile '{profile}' not found in {config_path}")
+    if profile != 'DEFAULT':
+        section = {**(_config_section(text, 'DEFAULT') or {}), **section}
+    
+    missing = [key for key in ('host', 'token') if key not in section]
+    if missing:
+        raise ValueError(f"Profile '{profile}' in {config_path} has no {' or '.join(missing)}")
+    return section['host'].strip(), section['token'].strip()
+
+
+def _connect_args(host: str, warehouse_id: str, token: str) -> Dict[str, str]:
+    """Return the sql.connect() arguments for a SQL warehouse."""
+    return dict(
+        server_hostname=host.removeprefix('https://'),
+        http_path=f'/sql/1.0/warehouses/{warehouse_id}',
+        access_token=token,
+    )
+
+
+def open_connection(host: str, token: str, warehouse_id: str, schema: str,
+                    staging_dir: Optional[str] = None):
+    """
+    Open a connection to the warehouse with `schema` in use; the caller closes
+    it. staging_dir allows PUT uploads of local files under that directory.
+    """
+    options = _connect_args(host, warehouse_id, token)
+    if staging_dir:
+        options['staging_allowed_local_path'] = staging_dir
+    connection = sql.connect(**options)
+    
+    # USE SCHEMA is session state, so every cursor on the connection sees it
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'USE SCHEMA {schema}')
+    except Exception:
+        connection.close()
+        raise
+    
+    return connection
+
+
+@lru_cache(maxsize=None)
+def get_connection(host: str, token: str, warehouse_id: str, schema: str,
+                   staging_dir: Optional[str] = None):
+    """
+    Return a connection like open_connection's, opening it on first call.
+    Later calls with the same arguments in this process reuse it, skipping
+    another TLS handshake and session setup; it is closed at exit.
+    """
+    connection = open_connection(host, token, warehouse_id, schema, staging_dir)
+    atexit.register(connection.close)
+    return connection
+
+
+def connect_warehouse(profile: str, warehouse_id: str, schema: str,
+                      staging_dir: Optional[str] = None):
+    """Connect to the warehouse with the credentials of a .databrickscfg profile."""
+    host, token = read_databricks_config(profile)
+    return get_connection(host, token, warehouse_id, schema, staging_dir)
+
+
+def create_tables(connections: ThreadConnections, fixtures: Dict[str, tuple], max_workers: int = 8,
+                  fresh: bool = False, staging_volume: Optional[str] = None):
+    """
+    Create or reload a generator's tables from their (columns, rows) fixtures.
+    The tables are independent, so they are built concurrently, each worker
+    on its own connection. With fresh=True every table is dropped first.
+    Returns True if every table loaded.
+    """
+    tables = list(fixtures)
+    connection = connections.get()
+    print(f"\n{Colors.CYAN}{Colors.BOLD}Creating Sample Tables{Colors.RESET}")
+    print("-" * 80)
+    
+    if fresh:
+        # Drop existing tables first to ensure clean schemas
+        print(f"  {Colors.YELLOW}Cleaning up existing tables...{Colors.RESET}")
+        drop_tables(connection, tables)
+        print(f"  {Colors.GREEN}✓ Cleanup complete{Colors.RESET}\n")
+        existing = set()
+    else:
+        existing = existing_tables(connection)
+    
+    with CursorPool(connections, max_workers) as pool:
+        for table, (columns, rows) in fixtures.items():
+            pool.submit(load_table, table, columns, rows, existing, staging_volume)
+    
+    loaded = sum(pool.results())
+    color = Colors.GREEN if loaded == len(tables) else Colors.YELLOW
+    print(f"  {color}{loaded}/{len(tables)} tables loaded{Colors.RESET}")
+    return loaded == len(tables)
+
+
+def verify_counts(cursor, tables: List[str]):
+    """Print each table's row count, fetched in one round trip."""
+    print(f"\n{Colors.CYAN}{Colors.BOLD}Verifying Data{Colors.RESET}")
+    print("-" * 80)
+    
+    cursor.execute(" UNION ALL ".join(
+        f"SELECT '{table}' AS table_name, COUNT(*) AS row_count FROM {table}" for table in tables
+    ))
+    for table, count in cursor.fetchall():
+        print(f"  {Colors.GREEN}✓{Colors.RESET} {table}: {count} rows")
+
+
+def run_generator(doc: str, title: str, tables: List[str]):
+    """Command-line entry point shared by the generators."""
+    parser = argparse.ArgumentParser(description=doc.strip().splitlines()[0])
+    parser.add_argument('--fresh', action='store_true',
+                        help='drop and recreate every table instead of reloading existing ones')
+    args = parser.parse_args()
+    
+    DATABRICKS_PROFILE = os.getenv('DATABRICKS_PROFILE', 'fe')
+    WAREHOUSE_ID = os.getenv('DATABRICKS_WAREHOUSE_ID')
+    # Concurrent CREATE/INSERT statements; keep within the warehouse's slot count
+    MAX_WORKERS = int(os.getenv('GEN_MAX_WORKERS', '8'))
+    # Unity Catalog volume for bulk loads, e.g. /Volumes/main/hql_test/staging
+    STAGING_VOLUME = os.getenv('GEN_STAGING_VOLUME')
+    SCHEMA = 'hql_test'  # Dedicated schema for migration testing
+    
+    print(f"{Colors.BLUE}{Colors.BOLD}{'='*80}{Colors.RESET}")
+    print(f"{Colors.BLUE}{Colors.BOLD}{title}{Colors.RESET}")
+    print(f"{Colors.BLUE}{Colors.BOLD}{'='*80}{Colors.RESET}")
+    
+    if not WAREHOUSE_ID:
+        print(f"\n{Colors.RED}✗ DATABRICKS_WAREHOUSE_ID environment variable not set{Colors.RESET}")
+        print(f"{Colors.YELLOW}Set it with: export DATABRICKS_WAREHOUSE_ID=your_warehouse_id{Colors.RESET}")
+        return
+    
+    # Read config
+    try:
+        host, token = read_databricks_config(DATABRICKS_PROFILE)
+        print(f"\n{Colors.GREEN}✓ Databricks config loaded{Colors.RESET}")
+        print(f"  Host: {host}")
+    except Exception as e:
+        print(f"\n{Colors.RED}✗ Failed to read config: {e}{Colors.RESET}")
+        return
+    
+    # Connect (reused if another generator already connected in this process)
+    try:
+        print(f"\n{Colors.YELLOW}Connecting to Databricks SQL...{Colors.RESET}")
+        # PUT may only upload files from the temp directory the CSVs are written to
+        staging_dir = tempfile.gettempdir() if STAGING_VOLUME else None
+        # A cold warehouse can take seconds to start; read the fixtures meanwhile
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(connect_warehouse, DATABRICKS_PROFILE, WAREHOUSE_ID,
+                                      SCHEMA, staging_dir)
+            fixtures = {table: load_fixture(table) for table in tables}
+            connection = pending.result()
+        print(f"{Colors.GREEN}✓ Connected successfully{Colors.RESET}")
+        
+        # The load workers open connections of their own; this one stays with the main thread
+        connect = partial(open_connection, host, token, WAREHOUSE_ID, SCHEMA, staging_dir)
+        with ThreadConnections(connect, connection) as connections, connection.cursor() as cursor:
+            print(f"{Colors.CYAN}Using schema: {SCHEMA}{Colors.RESET}\n")
+            
+            create_tables(connections, fixtures, MAX_WORKERS,
+                          fresh=args.fresh, staging_volume=STAGING_VOLUME)
+            verify_counts(cursor, tables)
+        
+        print(f"\n{Colors.GREEN}{Colors.BOLD}{'='*80}{Colors.RESET}")
+        print(f"{Colors.GREEN}{Colors.BOLD}Sample data created successfully!{Colors.RESET}")
+        print(f"{Colors.GREEN}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+        
+    except Exception as e:
+        print(f"{Colors.RED}✗ Error: {e}{Colors.RESET}")
@@ -5,15 +5,26 @@ This script uses Databricks AI_QUERY to automatically convert HiveQL to Spark SQ
 
 Environment Variables Required:
 - DATABRICKS_WAREHOUSE_ID: Your SQL warehouse ID
+
+Optional:
+- HQL_MAX_WORKERS: Concurrent EXPLAIN validations, shared by all files (default: 8)
+- HQL_BATCH_SIZE: Statements converted per AI_QUERY round trip (default: 16)
+- HQL_FILE_WORKERS: HQL files processed concurrently (default: 4)
 """
 
 import os
 import re
-import configparser
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Iterator
 from databricks import sql
-from databricks.sql.client import Connection
+from databricks.sql.client import Connection, Cursor
+from _common import ThreadConnections, collect_query, normalize_hql, read_databricks_config, submit_query
 
 # ANSI color codes for terminal output
 class Colors:
@@ -27,23 +38,37 @@ class Colors:
     BOLD = '\033[1m'
 
 
-def read_databricks_config(profile: str = 'DEFAULT') -> Tuple[str, str]:
-    """Read Databricks configuration from .databrickscfg file."""
-    config_path = Path.home() / '.databrickscfg'
-    
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-    
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    
-    if profile not in config:
-        raise ValueError(f"Profile '{profile}' not found in {config_path}")
-    
-    host = config[profile]['host'].strip()
-    token = config[profile]['token'].strip()
-    
-    return host, token
+# Statement extraction patterns
+_COMMENT_RE = re.compile(r'--[^\n]*')
+_CREATE_SPLIT_RE = re.compile(r'\n(?=CREATE\s+TABLE)', re.IGNORECASE)
+_TABLE_NAME_RE = re.compile(r'CREATE\s+TABLE\s+(\w+)', re.IGNORECASE)
+
+# SELECT body of a CREATE TABLE ... AS SELECT (AS and SELECT may be on separate lines)
+_AS_SELECT_RE = re.compile(r'\bAS\s+(SELECT\b.*)', re.IGNORECASE | re.DOTALL)
+
+# Per-statement status lines, formatted once; fill in with str.format()
+_MSG_FROM_CACHE = f"  {Colors.GREEN}[{{table}}] ✓ Conversion loaded from cache{Colors.RESET}"
+_MSG_BATCH_START = f"  {Colors.YELLOW}Step 1: Converting {{count}} statement(s) to Spark SQL with AI...{Colors.RESET}"
+_MSG_BATCH_ERROR = f"  {Colors.RED}✗ Batch conversion error, retrying statements individually: {{error}}{Colors.RESET}"
+_MSG_CONVERTING = f"  {Colors.YELLOW}[{{table}}] Step 1: Converting HQL to Spark SQL with AI...{Colors.RESET}"
+_MSG_CONVERTED = f"  {Colors.GREEN}[{{table}}] ✓ Conversion completed{Colors.RESET}"
+_MSG_CONVERT_FAILED = f"  {Colors.RED}[{{table}}] ✗ Conversion failed{Colors.RESET}"
+_MSG_CONVERT_ERROR = f"  {Colors.RED}[{{table}}] ✗ Conversion error: {{error}}{Colors.RESET}"
+_MSG_VALIDATING = f"  {Colors.YELLOW}[{{table}}] Step 2: Validating with EXPLAIN...{Colors.RESET}"
+_MSG_VALID = f"  {Colors.GREEN}[{{table}}] ✓ Validation passed{Colors.RESET}"
+_MSG_INVALID = f"  {Colors.RED}[{{table}}] ✗ Validation failed: {{error}}{Colors.RESET}"
+_FILE_BANNER = f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}"
+_MSG_PROCESSING = f"{Colors.CYAN}{Colors.BOLD}Processing: {{name}}{Colors.RESET}"
+_MSG_SAVED = f"{Colors.GREEN}✓ Saved converted SQL to: {{name}}{Colors.RESET}"
+
+# Statements are converted concurrently, so serialize terminal output
+_print_lock = threading.Lock()
+
+
+def log(message: str = '') -> None:
+    """Print a message without interleaving output from worker threads."""
+    with _print_lock:
+        print(message)
 
 
 def extract_statements(sql_content: str) -> List[Dict[str, str]]:
@@ -51,20 +76,11 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
     Extract individual SQL statements from a file.
     Split on CREATE TABLE statements.
     """
-    # Remove single-line comments but preserve the SQL
-    lines = sql_content.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        # Remove comments but keep the line structure
-        if '--' in line:
-            cleaned_lines.append(line.split('--')[0])
-        else:
-            cleaned_lines.append(line)
-    
-    sql_content = '\n'.join(cleaned_lines)
+    # Remove single-line comments but keep the line structure
+    sql_content = _COMMENT_RE.sub('', sql_content)
     
     # Split on CREATE TABLE
-    statements = re.split(r'\n(?=CREATE\s+TABLE)', sql_content, flags=re.IGNORECASE)
+    statements = _CREATE_SPLIT_RE.split(sql_content)
     
     # Clean up and filter empty statements
     result = []
@@ -72,7 +88,7 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
         stmt = stmt.strip()
         if stmt:
             # Extract table name
-            table_match = re.search(r'CREATE\s+TABLE\s+(\w+)', stmt, re.IGNORECASE)
+            table_match = _TABLE_NAME_RE.search(stmt)
             table_name = table_match.group(1) if table_match else "Unknown"
             result.append({
                 'table_name': table_name,
@@ -82,34 +98,15 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
     return result
 
 
-def convert_hql_with_ai(connection: Connection, hql_query: str, table_name: str) -> Dict:
-    """
-    Use AI_QUERY to convert HiveQL to Spark SQL.
-    """
-    result = {
-        'table_name': table_name,
-        'original_hql': hql_query,
-        'converted_sql': None,
-        'conversion_notes': None,
-        'valid': False,
-        'validation_error': None,
-        'explain_output': None
-    }
-    
-    # Escape single quotes for AI_QUERY
-    escaped_hql = hql_query.replace("'", "''")
-    
-    # Truncate if too long (AI_QUERY has limits)
-    if len(escaped_hql) > 3000:
-        escaped_hql = escaped_hql[:3000]
-        result['conversion_notes'] = "Query truncated for AI_QUERY processing"
-    
-    print(f"  {Colors.YELLOW}Step 1: Converting HQL to Spark SQL with AI...{Colors.RESET}")
-    
-    try:
-        with connection.cursor() as cursor:
-            # Use AI_QUERY to convert HQL to Spark SQL
-            conversion_prompt = f"""Convert this HiveQL query to Databricks Spark SQL. 
+AI_MODEL = 'databricks-meta-llama-3-1-70b-instruct'
+
+# Bump whenever the conversion prompt changes so cached conversions are invalidated
+PROMPT_VERSION = '1'
+
+# AI_QUERY input limit per statement (characters of HQL)
+MAX_HQL_CHARS = 3000
+
+CONVERSION_PROMPT_PREFIX = """Convert this HiveQL query to Databricks Spark SQL. 
 
 Key conversions needed:
 - Remove DISTRIBUTE BY, SORT BY (use CLUSTERED BY in table definition or remove entirely)
@@ -124,113 +121,456 @@ Key conversions needed:
 Return ONLY the converted SQL, no explanations. If there are critical issues, add a comment at the top.
 
 HiveQL Query:
-{escaped_hql}
+"""
+
+CONVERSION_PROMPT_SUFFIX = """
 
 Converted Spark SQL:"""
 
-            ai_query = f"""
-            SELECT AI_QUERY(
-                'databricks-meta-llama-3-1-70b-instruct',
-                '{conversion_prompt}'
+AI_QUERY_SQL = f"""
+        SELECT AI_QUERY(
+            '{AI_MODEL}',
+            :prompt
+        ) as converted_sql
+        """
+
+
+class ConversionCache:
+    """
+    Persistent on-disk cache of validated AI_QUERY conversions.
+    Entries are keyed by SHA-256 of the HQL, model and prompt version, so
+    re-running the converter only pays for statements that changed.
+    A second tier keyed by the normalized HQL (see normalize_hql) catches
+    near-duplicates that differ only in formatting or keyword case.
+    """
+    
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                input_hash TEXT PRIMARY KEY,
+                prompt_version TEXT,
+                converted_sql TEXT,
+                created_at INTEGER
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS similar_cache (
+                normalized_hash TEXT PRIMARY KEY,
+                prompt_version TEXT,
+                converted_sql TEXT,
+                created_at INTEGER
+            )
+        """)
+        self._db.commit()
+    
+    @staticmethod
+    def key(hql_query: str) -> str:
+        """Cache key for an HQL statement under the current model and prompt."""
+        material = f"{PROMPT_VERSION}\n{AI_MODEL}\n{hql_query}"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def similar_key(cls, hql_query: str) -> str:
+        """Cache key shared by all formatting variants of an HQL statement."""
+        return cls.key(normalize_hql(hql_query))
+    
+    def get(self, hql_query: str) -> Optional[str]:
+        """Return the cached conversion for an HQL statement, if any."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT converted_sql FROM cache WHERE input_hash = ? AND prompt_version = ?",
+                (self.key(hql_query), PROMPT_VERSION)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def get_similar(self, hql_query: str) -> Optional[str]:
+        """
+        Return the conversion of a near-duplicate HQL statement, if any.
+        Callers should validate the result and fall back to AI_QUERY on failure.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT converted_sql FROM similar_cache WHERE normalized_hash = ? AND prompt_version = ?",
+                (self.similar_key(hql_query), PROMPT_VERSION)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def put(self, hql_query: str, converted_sql: str):
+        """Store a successful conversion in both tiers."""
+        now = int(time.time())
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (self.key(hql_query), PROMPT_VERSION, converted_sql, now)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO similar_cache VALUES (?, ?, ?, ?)",
+                (self.similar_key(hql_query), PROMPT_VERSION, converted_sql, now)
+            )
+            self._db.commit()
+    
+    def close(self):
+        """Close the cache database."""
+        with self._lock:
+            self._db.close()
+
+
+class ExplainCache:
+    """
+    Remembers EXPLAIN outcomes for the current run, keyed by the statement
+    explained. A thread asking for a statement that is already being explained
+    waits for that result instead of issuing a duplicate EXPLAIN.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+    
+    def claim(self, statement: str) -> Tuple[Future, bool]:
+        """
+        Return the entry for a statement and whether the caller owns it.
+        The owner must run the EXPLAIN and set_result() on the entry.
+        """
+        key = hashlib.md5(statement.encode('utf-8')).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = self._entries[key] = Future()
+            return entry, True
+
+
+def new_result(hql_query: str, table_name: str) -> Dict:
+    """Create an empty conversion result for a statement."""
+    return {
+        'table_name': table_name,
+        'original_hql': hql_query,
+        'converted_sql': None,
+        'conversion_notes': None,
+        'valid': False,
+        'validation_error': None,
+        'explain_output': None,
+        'cache_hit': None  # None, 'exact' or 'similar'
+    }
+
+
+def prepare_hql(hql_query: str) -> Tuple[str, str]:
+    """
+    Prepare HQL for AI_QUERY. The HQL is sent as a bound parameter, so no
+    quote escaping is needed.
+    Returns (hql, conversion_note_or_None).
+    """
+    # Truncate if too long (AI_QUERY has limits)
+    if len(hql_query) > MAX_HQL_CHARS:
+        return safe_truncate(hql_query, MAX_HQL_CHARS)
+    
+    return hql_query, None
+
+
+def safe_truncate(hql_query: str, limit: int) -> Tuple[str, str]:
+    """
+    Truncate HQL to at most `limit` characters without cutting through a
+    keyword or literal: prefer the last statement end (;), then the last
+    closing parenthesis, then the last whitespace before the limit.
+    Returns (truncated_hql, conversion_note).
+    """
+    for boundary, description in ((';', 'statement boundary'), (')', 'closing parenthesis')):
+        idx = hql_query.rfind(boundary, 0, limit)
+        if idx > 0:
+            return hql_query[:idx + 1], f"Query truncated at {description} for AI_QUERY processing"
+    
+    idx = max(hql_query.rfind(ws, 0, limit + 1) for ws in (' ', '\n', '\t'))
+    if idx > 0:
+        return hql_query[:idx], "Query truncated at token boundary for AI_QUERY processing"
+    
+    return hql_query[:limit], "Query truncated for AI_QUERY processing"
+
+
+def build_batch_query(batch: List[Dict]) -> Tuple[str, Dict[str, str]]:
+    """
+    Build one AI_QUERY over a VALUES table holding every statement of a batch.
+    The prompt and HQL are passed as named parameters, so the query text only
+    depends on the batch size.
+    Sets the truncation note on each result as a side effect.
+    Returns (query, parameters).
+    """
+    parameters = {
+        'prompt_prefix': CONVERSION_PROMPT_PREFIX,
+        'prompt_suffix': CONVERSION_PROMPT_SUFFIX,
+    }
+    rows = []
+    for i, result in enumerate(batch):
+        hql, note = prepare_hql(result['original_hql'])
+        result['conversion_notes'] = note
+        parameters[f'hql{i}'] = hql
+        rows.append(f"({i}, :hql{i})")
+    
+    query = f"""
+            SELECT id, AI_QUERY(
+                '{AI_MODEL}',
+                CONCAT(:prompt_prefix, hql, :prompt_suffix)
             ) as converted_sql
+            FROM VALUES {', '.join(rows)} AS t(id, hql)
             """
-            
-            cursor.execute(ai_query)
-            ai_result = cursor.fetchone()
-            
-            if ai_result and ai_result[0]:
-                converted_sql = ai_result[0]
+    return query, parameters
+
+
+def convert_hql_batch(connection: Connection, results: List[Dict], batch_size: int = 16,
+                      cache: Optional[ConversionCache] = None,
+                      window: int = 8) -> Iterator[List[Dict]]:
+    """
+    Convert many HQL statements with one AI_QUERY round trip per batch.
+    The statements are packed into a VALUES table so the warehouse runs the
+    LLM calls for all rows of a batch in a single query.
+    Fills in converted_sql on the given results and yields them batch by batch
+    as each completes, so callers can start validating early.
+    Up to `window` batch queries are kept in flight at once, each on its own cursor.
+    If a whole batch fails, its statements fall back to one call each.
+    Statements found in the cache are not sent to AI_QUERY at all.
+    """
+    pending = []
+    cached = []
+    for result in results:
+        cached_sql = None
+        if cache:
+            cached_sql = cache.get(result['original_hql'])
+            result['cache_hit'] = 'exact' if cached_sql else None
+            if not cached_sql:
+                cached_sql = cache.get_similar(result['original_hql'])
+                result['cache_hit'] = 'similar' if cached_sql else None
+        
+        if cached_sql:
+            _, result['conversion_notes'] = prepare_hql(result['original_hql'])
+            result['converted_sql'] = cached_sql
+            cached.append(result)
+            log(_MSG_FROM_CACHE.format(table=result['table_name']))
+        else:
+            pending.append(result)
+    
+    if cached:
+        yield cached
+    
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    if not batches:
+        return
+    
+    cursors = [connection.cursor() for _ in range(min(max(1, window), len(batches)))]
+    in_flight = deque()
+    
+    def finish(batch: List[Dict], cursor: Cursor, error: Optional[Exception]) -> List[Dict]:
+        converted = {}
+        if error is None:
+            try:
+                converted = {row[0]: row[1] for row in collect_query(cursor)}
+            except Exception as e:
+                error = e
+        
+        if error is not None:
+            log(_MSG_BATCH_ERROR.format(error=error))
+            for result in batch:
+                converted_sql, conversion_error = convert_hql_with_ai(cursor, result['original_hql'], result['table_name'], cache)
                 result['converted_sql'] = converted_sql
-                print(f"  {Colors.GREEN}✓ Conversion completed{Colors.RESET}")
+                result['validation_error'] = conversion_error
+            return batch
+        
+        for i, result in enumerate(batch):
+            if converted.get(i):
+                result['converted_sql'] = converted[i]
+                log(_MSG_CONVERTED.format(table=result['table_name']))
             else:
                 result['validation_error'] = "AI_QUERY returned empty result"
-                print(f"  {Colors.RED}✗ Conversion failed{Colors.RESET}")
-                return result
-                
-    except Exception as e:
-        result['validation_error'] = f"AI_QUERY conversion failed: {str(e)}"
-        print(f"  {Colors.RED}✗ Conversion error: {str(e)}{Colors.RESET}")
-        return result
+                log(_MSG_CONVERT_FAILED.format(table=result['table_name']))
+        return batch
     
-    # Now validate the converted SQL with EXPLAIN
-    print(f"  {Colors.YELLOW}Step 2: Validating with EXPLAIN...{Colors.RESET}")
+    try:
+        for index, batch in enumerate(batches):
+            # Window full: the oldest batch's cursor is the one this batch reuses
+            if len(in_flight) == len(cursors):
+                yield finish(*in_flight.popleft())
+            
+            log(_MSG_BATCH_START.format(count=len(batch)))
+            cursor = cursors[index % len(cursors)]
+            in_flight.append((batch, cursor, submit_query(cursor, *build_batch_query(batch))))
+        
+        while in_flight:
+            yield finish(*in_flight.popleft())
+    finally:
+        for cursor in cursors:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def convert_hql_with_ai(cursor: Cursor, hql_query: str, table_name: str,
+                        cache: Optional[ConversionCache] = None) -> Tuple[str, str]:
+    """
+    Use AI_QUERY to convert a single HiveQL statement to Spark SQL.
+    Returns (converted_sql, error) - exactly one of them is None.
+    """
+    cached_sql = cache.get(hql_query) if cache else None
+    if cached_sql:
+        log(_MSG_FROM_CACHE.format(table=table_name))
+        return cached_sql, None
+    
+    hql, _ = prepare_hql(hql_query)
+    
+    log(_MSG_CONVERTING.format(table=table_name))
     
     try:
-        with connection.cursor() as cursor:
-            # Extract SELECT portion for EXPLAIN
-            converted_sql = result['converted_sql']
+        # Use AI_QUERY to convert HQL to Spark SQL; the prompt is a bound
+        # parameter so the statement text is identical for every call
+        conversion_prompt = f"{CONVERSION_PROMPT_PREFIX}{hql}{CONVERSION_PROMPT_SUFFIX}"
+        
+        cursor.execute(AI_QUERY_SQL, {'prompt': conversion_prompt})
+        ai_result = cursor.fetchone()
+        
+        if ai_result and ai_result[0]:
+            log(_MSG_CONVERTED.format(table=table_name))
+            return ai_result[0], None
+        
+        log(_MSG_CONVERT_FAILED.format(table=table_name))
+        return None, "AI_QUERY returned empty result"
             
-            if 'AS SELECT' in converted_sql.upper() or 'AS\nSELECT' in converted_sql.upper():
-                match = re.search(r'\bAS\s+(SELECT\b.*)', converted_sql, flags=re.IGNORECASE | re.DOTALL)
-                if match:
-                    select_statement = match.group(1).rstrip(';').strip()
-                    explain_query = f"EXPLAIN {select_statement}"
-                    cursor.execute(explain_query)
-                    explain_results = cursor.fetchall()
-                    result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:10]])
-                    result['valid'] = True
-                    print(f"  {Colors.GREEN}✓ Validation passed{Colors.RESET}")
-            else:
-                # Try to explain the whole thing
-                explain_query = f"EXPLAIN {converted_sql.rstrip(';')}"
-                cursor.execute(explain_query)
-                explain_results = cursor.fetchall()
-                result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:10]])
-                result['valid'] = True
-                print(f"  {Colors.GREEN}✓ Validation passed{Colors.RESET}")
-                
-    except Exception as explain_error:
-        result['validation_error'] = f"EXPLAIN validation failed: {str(explain_error)}"
+    except Exception as e:
+        log(_MSG_CONVERT_ERROR.format(table=table_name, error=e))
+        return None, f"AI_QUERY conversion failed: {str(e)}"
+
+
+def validate_converted_sql(cursor: Cursor, result: Dict,
+                           explain_cache: Optional[ExplainCache] = None) -> Dict:
+    """
+    Validate a converted statement with EXPLAIN, updating the result in place.
+    Statements already explained in this run reuse the cached outcome.
+    """
+    table_name = result['table_name']
+    log(_MSG_VALIDATING.format(table=table_name))
+    
+    # EXPLAIN the SELECT portion of a CTAS, otherwise the whole statement
+    converted_sql = result['converted_sql']
+    match = _AS_SELECT_RE.search(converted_sql)
+    if match:
+        select_statement = match.group(1).rstrip(';').strip()
+    else:
+        select_statement = converted_sql.rstrip(';')
+    
+    entry, owner = explain_cache.claim(select_statement) if explain_cache else (None, True)
+    if owner:
+        try:
+            cursor.execute(f"EXPLAIN {select_statement}")
+            # Only the first 10 plan lines are kept, so don't pull the rest over the wire
+            explain_rows = cursor.fetchmany(10)
+            outcome = (True, '\n'.join(str(row[0]) for row in explain_rows))
+        except Exception as explain_error:
+            outcome = (False, str(explain_error))
+        if entry is not None:
+            entry.set_result(outcome)
+    else:
+        outcome = entry.result()
+    
+    valid, detail = outcome
+    if valid:
+        result['explain_output'] = detail
+        result['valid'] = True
+        log(_MSG_VALID.format(table=table_name))
+    else:
+        result['validation_error'] = f"EXPLAIN validation failed: {detail}"
         result['valid'] = False
-        print(f"  {Colors.RED}✗ Validation failed: {str(explain_error)}{Colors.RESET}")
+        log(_MSG_INVALID.format(table=table_name, error=detail))
     
     return result
 
 
-def process_hql_file(connection: Connection, file_path: Path, output_dir: Path) -> List[Dict]:
+def read_sql_file(file_path: Path) -> str:
+    """Read a SQL file in one read, decoding the bytes directly."""
+    return file_path.read_bytes().decode('utf-8')
+
+
+def format_converted_block(result: Dict, file_name: str) -> str:
+    """Format one converted statement for the *_converted.sql output file."""
+    lines = [
+        f"-- Table: {result['table_name']}",
+        f"-- Original file: {file_name}",
+        f"-- Validation: {'PASSED' if result['valid'] else 'FAILED'}",
+    ]
+    if result['conversion_notes']:
+        lines.append(f"-- Notes: {result['conversion_notes']}")
+    lines.extend(["", result['converted_sql'], "", "-" * 80, ""])
+    return '\n'.join(lines)
+
+
+def process_hql_file(connections: ThreadConnections, file_path: Path, output_dir: Path,
+                     validators: ThreadPoolExecutor, batch_size: int = 16,
+                     cache: Optional[ConversionCache] = None,
+                     explain_cache: Optional[ExplainCache] = None) -> List[Dict]:
     """
     Process a single HQL file: convert all statements and validate.
+    Statements are converted in pipelined AI_QUERY batches on the calling
+    thread's connection and validated concurrently on the validators pool,
+    shared by all files; each thread uses its own connection from connections.
+    Converted SQL is written out statement by statement as validation completes.
     """
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}Processing: {file_path.name}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
-    
-    with open(file_path, 'r') as f:
-        hql_content = f.read()
+    log(f"\n{_FILE_BANNER}\n{_MSG_PROCESSING.format(name=file_path.name)}\n{_FILE_BANNER}\n")
     
+    hql_content = read_sql_file(file_path)
     statements = extract_statements(hql_content)
-    results = []
-    converted_statements = []
     
-    for i, stmt_info in enumerate(statements, 1):
-        table_name = stmt_info['table_name']
-        hql_query = stmt_info['hql']
-        
-        print(f"{Colors.YELLOW}{Colors.BOLD}[{i}/{len(statements)}] Converting: {table_name}{Colors.RESET}")
-        result = convert_hql_with_ai(connection, hql_query, table_name)
-        result['file'] = file_path.stem
-        results.append(result)
-        
-        if result['converted_sql']:
-            converted_statements.append(f"-- Table: {table_name}")
-            converted_statements.append(f"-- Original file: {file_path.name}")
-            converted_statements.append(f"-- Validation: {'PASSED' if result['valid'] else 'FAILED'}")
-            if result['conversion_notes']:
-                converted_statements.append(f"-- Notes: {result['conversion_notes']}")
-            converted_statements.append("")
-            converted_statements.append(result['converted_sql'])
-            converted_statements.append("")
-            converted_statements.append("-" * 80)
-            converted_statements.append("")
+    results = [new_result(s['hql'], s['table_name']) for s in statements]
+    validations = {}
+    
+    def validate(result: Dict) -> Dict:
+        with connections.get().cursor() as cursor:
+            validate_converted_sql(cursor, result, explain_cache)
+            
+            # A cached conversion that doesn't validate (a near-duplicate's, or one
+            # the schema has moved on from) is not trusted: convert for real and
+            # validate again
+            if not result['valid'] and result['cache_hit']:
+                converted_sql, error = convert_hql_with_ai(cursor, result['original_hql'], result['table_name'])
+                result.update(converted_sql=converted_sql, validation_error=error, cache_hit=None, explain_output=None)
+                if converted_sql:
+                    validate_converted_sql(cursor, result, explain_cache)
+            
+            # Only conversions that passed EXPLAIN are cached, so a bad one is
+            # retried on the next run rather than replayed
+            if cache and result['valid'] and result['cache_hit'] != 'exact':
+                cache.put(result['original_hql'], result['converted_sql'])
+        return result
+    
+    output_file = output_dir / f"{file_path.stem}_converted.sql"
+    out_f = None
+    try:
+        # EXPLAIN each batch as soon as its AI_QUERY returns, overlapping
+        # validation with the batches still being converted
+        for batch in convert_hql_batch(connections.get(), results, batch_size, cache):
+            for result in batch:
+                if result['converted_sql']:
+                    validations[id(result)] = validators.submit(validate, result)
         
-        print()
+        # Write blocks in statement order as their validation completes
+        for result in results:
+            result['file'] = file_path.stem
+            if id(result) not in validations:
+                continue
+            validations[id(result)].result()
+            if not result['converted_sql']:
+                continue
+            
+            if out_f is None:
+                out_f = open(output_file, 'w', encoding='utf-8', buffering=1 << 20)
+            else:
+                out_f.write('\n')
+            out_f.write(format_converted_block(result, file_path.name))
+    finally:
+        if out_f is not None:
+            out_f.close()
+    
+    log()
     
-    # Save converted SQL to file
-    if converted_statements:
-        output_file = output_dir / f"{file_path.stem}_converted.sql"
-        with open(output_file, 'w') as f:
-            f.write('\n'.join(converted_statements))
-        print(f"{Colors.GREEN}✓ Saved converted SQL to: {output_file.name}{Colors.RESET}")
+    if out_f is not None:
+        log(_MSG_SAVED.format(name=output_file.name))
     
     return results
 
@@ -238,8 +578,13 @@ def process_hql_file(connection: Connection, file_path: Path, output_dir: Path)
 def print_summary(all_results: List[Dict]):
     """Print a summary of conversion and validation results."""
     total = len(all_results)
-    converted = sum(1 for r in all_results if r['converted_sql'] is not None)
-    valid = sum(1 for r in all_results if r['valid'])
+    converted = valid = 0
+    failed = []
+    for r in all_results:
+        converted += r['converted_sql'] is not None
+        valid += bool(r['valid'])
+        if r['converted_sql'] and not r['valid']:
+            failed.append(r)
     
     print(f"\n{Colors.MAGENTA}{Colors.BOLD}{'='*80}{Colors.RESET}")
     print(f"{Colors.MAGENTA}{Colors.BOLD}CONVERSION & VALIDATION SUMMARY{Colors.RESET}")
@@ -254,40 +599,44 @@ def print_summary(all_results: List[Dict]):
     
     if converted - valid > 0:
         print(f"{Colors.RED}{Colors.BOLD}Queries that failed validation:{Colors.RESET}\n")
-        for result in all_results:
-            if result['converted_sql'] and not result['valid']:
-                print(f"  {Colors.RED}✗ {result['file']} - {result['table_name']}{Colors.RESET}")
-                print(f"    Error: {result['validation_error']}\n")
+        for result in failed:
+            print(f"  {Colors.RED}✗ {result['file']} - {result['table_name']}{Colors.RESET}")
+            print(f"    Error: {result['validation_error']}\n")
 
 
 def save_detailed_results(all_results: List[Dict], output_file: Path):
     """Save detailed conversion and validation results to a file."""
-    with open(output_file, 'w') as f:
-        f.write("=" * 80 + "\n")
-        f.write("HQL to Spark SQL Conversion & Validation Results\n")
-        f.write("Using AI_QUERY for conversion and EXPLAIN for validation\n")
-        f.write("=" * 80 + "\n\n")
+    separator = "=" * 80 + "\n"
+    parts = [
+        separator,
+        "HQL to Spark SQL Conversion & Validation Results\n",
+        "Using AI_QUERY for conversion and EXPLAIN for validation\n",
+        separator + "\n",
+    ]
+    
+    for result in all_results:
+        parts.append(f"\nFile: {result['file']}\n")
+        parts.append(f"Table: {result['table_name']}\n")
+        parts.append(f"Conversion: {'✓ SUCCESS' if result['converted_sql'] else '✗ FAILED'}\n")
+        parts.append(f"Validation: {'✓ PASSED' if result['valid'] else '✗ FAILED'}\n")
+        parts.append("-" * 80 + "\n")
         
-        for result in all_results:
-            f.write(f"\nFile: {result['file']}\n")
-            f.write(f"Table: {result['table_name']}\n")
-            f.write(f"Conversion: {'✓ SUCCESS' if result['converted_sql'] else '✗ FAILED'}\n")
-            f.write(f"Validation: {'✓ PASSED' if result['valid'] else '✗ FAILED'}\n")
-            f.write("-" * 80 + "\n")
-            
-            if result['conversion_notes']:
-                f.write(f"\nNotes:\n{result['conversion_notes']}\n")
-            
-            if result['validation_error']:
-                f.write(f"\nError:\n{result['validation_error']}\n")
-            
-            if result['converted_sql']:
-                f.write(f"\nConverted SQL:\n{result['converted_sql']}\n")
-            
-            if result['explain_output']:
-                f.write(f"\nEXPLAIN Output (first 10 lines):\n{result['explain_output']}\n")
-            
-            f.write("\n" + "=" * 80 + "\n")
+        if result['conversion_notes']:
+            parts.append(f"\nNotes:\n{result['conversion_notes']}\n")
+        
+        if result['validation_error']:
+            parts.append(f"\nError:\n{result['validation_error']}\n")
+        
+        if result['converted_sql']:
+            parts.append(f"\nConverted SQL:\n{result['converted_sql']}\n")
+        
+        if result['explain_output']:
+            parts.append(f"\nEXPLAIN Output (first 10 lines):\n{result['explain_output']}\n")
+        
+        parts.append("\n" + separator)
+    
+    with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.writelines(parts)
 
 
 def main():
@@ -295,6 +644,10 @@ def main():
     # Configuration
     DATABRICKS_PROFILE = os.getenv('DATABRICKS_PROFILE', 'fe')
     WAREHOUSE_ID = os.getenv('DATABRICKS_WAREHOUSE_ID')
+    # Concurrent EXPLAIN calls across all files; keep within the warehouse's slot count
+    MAX_WORKERS = int(os.getenv('HQL_MAX_WORKERS', '8'))
+    BATCH_SIZE = int(os.getenv('HQL_BATCH_SIZE', '16'))
+    FILE_WORKERS = int(os.getenv('HQL_FILE_WORKERS', '4'))
     
     # Get script directory and set up paths
     script_dir = Path(__file__).parent.parent
@@ -304,8 +657,17 @@ def main():
     # Create output directory
     output_dir.mkdir(exist_ok=True)
     
-    # Find all .hql files
-    hql_files = sorted(hql_dir.glob('script*.hql'))
+    # Find all .hql files; scandir's entries carry their file type, so no extra stat per file
+    try:
+        with os.scandir(hql_dir) as entries:
+            hql_files = sorted(
+                (Path(entry.path) for entry in entries
+                 if entry.name.startswith('script') and entry.name.endswith('.hql')
+                 and entry.is_file()),
+                key=lambda p: p.name
+            )
+    except FileNotFoundError:
+        hql_files = []
     
     if not hql_files:
         print(f"{Colors.RED}No HQL files found in {hql_dir}{Colors.RESET}")
@@ -344,11 +706,14 @@ def main():
             print(f"{Colors.YELLOW}No WAREHOUSE_ID set. Attempting default connection...{Colors.RESET}")
             http_path = '/sql/1.0/warehouses/default'
         
-        connection = sql.connect(
-            server_hostname=server_hostname,
-            http_path=http_path,
-            access_token=token
-        )
+        def connect() -> Connection:
+            return sql.connect(
+                server_hostname=server_hostname,
+                http_path=http_path,
+                access_token=token
+            )
+        
+        connection = connect()
         print(f"{Colors.GREEN}✓ Connected successfully{Colors.RESET}")
         
     except Exception as e:
@@ -357,13 +722,32 @@ def main():
         print(f"{Colors.YELLOW}Update WAREHOUSE_ID in the script with your warehouse ID.{Colors.RESET}")
         return
     
-    # Process all HQL files
+    # Reuse conversions from previous runs, and EXPLAIN results within this one
+    cache = ConversionCache(output_dir / 'conversion_cache.db')
+    explain_cache = ExplainCache()
+    
+    # Every file and validation thread gets its own connection (the connector's
+    # threadsafety level is 1); the first taker is lent this one
+    connections = ThreadConnections(connect, connection)
+    
+    # Process HQL files concurrently; each file's output is independent. The
+    # validation pool is shared, so at most FILE_WORKERS + MAX_WORKERS
+    # connections are open.
     all_results = []
     try:
-        for hql_file in hql_files:
-            file_results = process_hql_file(connection, hql_file, output_dir)
-            all_results.extend(file_results)
+        with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as validators, \
+                ThreadPoolExecutor(max_workers=max(1, min(len(hql_files), FILE_WORKERS))) as executor:
+            file_results = executor.map(
+                lambda hql_file: process_hql_file(connections, hql_file, output_dir, validators,
+                                                  BATCH_SIZE, cache, explain_cache),
+                hql_files
+            )
+            # map() preserves file order, keeping the summary stable between runs
+            for results in file_results:
+                all_results.extend(results)
     finally:
+        cache.close()
+        connections.close()
         if connection:
             connection.close()
             print(f"\n{Colors.YELLOW}Connection closed{Colors.RESET}")
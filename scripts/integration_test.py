@@ -8,13 +8,14 @@ Run: python scripts/generate_sample_data.py
 """
 
 import os
-import configparser
+import mmap
 from pathlib import Path
-from typing import Tuple, List, Dict
+from typing import Callable, Iterator, NamedTuple, Optional, List, Dict, Set
 from databricks import sql
 import re
-import subprocess
-import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from _common import CursorPool, ThreadConnections, drop_tables, log, read_databricks_config
+import generate_sample_data
 
 # ANSI color codes
 class Colors:
@@ -28,184 +29,323 @@ class Colors:
     BOLD = '\033[1m'
 
 
-def read_databricks_config(profile: str = 'DEFAULT') -> Tuple[str, str]:
-    """Read Databricks configuration from .databrickscfg file."""
-    config_path = Path.home() / '.databrickscfg'
-    
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-    
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    
-    if profile not in config:
-        raise ValueError(f"Profile '{profile}' not found in {config_path}")
-    
-    host = config[profile]['host'].strip()
-    token = config[profile]['token'].strip()
-    
-    return host, token
+# Full-width rule framing section titles
+_RULE = '=' * 80
+
+
+def banner(color: str, title: str) -> str:
+    """Return a title framed by rules, styled once so it prints in one call."""
+    style = f"{color}{Colors.BOLD}"
+    return f"{style}{_RULE}{Colors.RESET}\n{style}{title}{Colors.RESET}\n{style}{_RULE}{Colors.RESET}"
+
 
+# Patterns for picking statements out of the converted SQL files; these scan
+# the raw file bytes so only the extracted statements are decoded
+_SEP_RE = re.compile(rb'-{80}')
+_TABLE_COMMENT_RE = re.compile(rb'-- Table: (\w+)')
+_CREATE_RE = re.compile(rb'(CREATE (?:OR REPLACE )?(?:TABLE|FUNCTION).*?)(?=\n--|\n\n-{80}|$)', re.DOTALL | re.IGNORECASE)
+_CREATE_FUNCTION_RE = re.compile(r'CREATE FUNCTION', re.IGNORECASE)
+_UDF_RE = re.compile(r'(CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+\w+\s*\([^)]*\)\s*RETURNS\s+\w+\s+RETURN\s+[^;]+)', re.IGNORECASE | re.DOTALL)
 
-def extract_create_statements(sql_content: str) -> List[Dict[str, str]]:
-    """Extract individual CREATE TABLE and CREATE FUNCTION statements from SQL file."""
+
+def _iter_parts(sql_content: bytes) -> Iterator[bytes]:
+    """Yield the text between separator lines, one part at a time."""
+    start = 0
+    for match in _SEP_RE.finditer(sql_content):
+        yield sql_content[start:match.start()]
+        start = match.end()
+    yield sql_content[start:]
+
+
+def _statement(table_name: str, sql: str) -> Dict:
+    """
+    Build a statement entry. UDF definitions are marked kind 'udf' and split
+    into their CREATE FUNCTION statements here, once, instead of at execution.
+    """
+    stmt_info = {'table_name': table_name, 'sql': sql, 'kind': 'table'}
+    # UDF definitions might have multiple statements. The table name decides
+    # for UDF files; other bodies are searched in place rather than upper-cased.
+    if table_name == 'UDF_Definitions' or _CREATE_FUNCTION_RE.search(sql):
+        stmt_info['kind'] = 'udf'
+        # Extract CREATE FUNCTION statements using regex (handles comments better)
+        stmt_info['udf_statements'] = [udf_sql.strip() for udf_sql in _UDF_RE.findall(sql)]
+    return stmt_info
+
+
+def extract_create_statements(sql_content: bytes) -> List[Dict]:
+    """
+    Extract individual CREATE TABLE and CREATE FUNCTION statements from a SQL
+    file's UTF-8 content (bytes or an mmap).
+    """
     statements = []
     
-    # Split by separator lines
-    parts = sql_content.split('-' * 80)
-    
-    for part in parts:
+    # Walk the parts between separator lines
+    for part in _iter_parts(sql_content):
         part = part.strip()
         if not part:
             continue
             
         # Extract table name from comment
-        table_match = re.search(r'-- Table: (\w+)', part)
-        table_name = table_match.group(1) if table_match else "Unknown"
+        table_match = _TABLE_COMMENT_RE.search(part)
+        table_name = table_match.group(1).decode('ascii') if table_match else "Unknown"
         
         # Extract CREATE TABLE or CREATE FUNCTION statements
         # Try CREATE TABLE first
-        create_match = re.search(r'(CREATE (?:OR REPLACE )?(?:TABLE|FUNCTION).*?)(?=\n--|\n\n-{80}|$)', part, flags=re.DOTALL | re.IGNORECASE)
+        create_match = _CREATE_RE.search(part)
         if create_match:
-            sql = create_match.group(1).strip()
-            statements.append({
-                'table_name': table_name,
-                'sql': sql
-            })
+            sql = create_match.group(1).strip().decode('utf-8')
+            statements.append(_statement(table_name, sql))
         # If no CREATE statement but has UDF definitions, extract all of them
-        elif 'CREATE OR REPLACE FUNCTION' in part:
-            statements.append({
-                'table_name': table_name,
-                'sql': part
-            })
+        elif b'CREATE OR REPLACE FUNCTION' in part:
+            statements.append(_statement(table_name, part.decode('utf-8')))
     
     return statements
 
 
-def execute_statement(cursor, sql: str, table_name: str) -> Dict:
+# Files at least this large are scanned through mmap instead of being read in
+MMAP_MIN_BYTES = 1 << 20
+
+
+def read_statements(file_path: Path) -> List[Dict]:
+    """
+    Extract a SQL file's statements. Large files are scanned through a
+    read-only mmap; smaller ones are cheaper to read in a single call.
+    Either way the statements are decoded as UTF-8.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_MIN_BYTES:
+            return extract_create_statements(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as sql_content:
+            return extract_create_statements(sql_content)
+
+
+# Longest error message kept per statement; warehouse errors can run to kilobytes
+MAX_ERROR_LENGTH = 512
+
+
+def _error_text(error, limit: int = MAX_ERROR_LENGTH) -> str:
+    """Stringify an error once, truncated to limit characters."""
+    message = str(error)
+    return message if len(message) <= limit else message[:limit - 3] + '...'
+
+
+class StatementResult(NamedTuple):
+    """Outcome of executing one statement from a SQL file."""
+    table_name: str
+    success: bool
+    error: Optional[str] = None
+    file: str = ''
+
+
+def execute_pipelined(cursor, statements: List[str]) -> List[str]:
+    """
+    Execute independent statements and return the errors of those that failed,
+    in statement order. When the connector supports execute_async, every
+    statement is submitted on its own cursor before any is awaited, so together
+    they cost about one round trip; otherwise they run one after another.
+    """
+    errors = [None] * len(statements)
+    if len(statements) < 2 or not hasattr(cursor, 'execute_async'):
+        for i, statement in enumerate(statements):
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                errors[i] = _error_text(e, 150)
+        return [error for error in errors if error]
+    
+    cursors = [cursor] + [cursor.connection.cursor() for _ in statements[1:]]
+    submitted = []
+    try:
+        # Pass 1: submit everything; pass 2: await each in order
+        for i, (statement_cursor, statement) in enumerate(zip(cursors, statements)):
+            try:
+                statement_cursor.execute_async(statement)
+                submitted.append(i)
+            except Exception as e:
+                errors[i] = _error_text(e, 150)
+        
+        for i in submitted:
+            try:
+                cursors[i].get_async_execution_result()
+            except Exception as e:
+                errors[i] = _error_text(e, 150)
+    finally:
+        for extra_cursor in cursors[1:]:
+            extra_cursor.close()
+    
+    return [error for error in errors if error]
+
+
+def execute_statement(cursor, stmt_info: Dict) -> StatementResult:
     """Execute a single SQL statement (CREATE TABLE or CREATE FUNCTION)."""
-    result = {
-        'table_name': table_name,
-        'success': False,
-        'error': None
-    }
+    success = False
+    error = None
     
     try:
-        # UDF definitions might have multiple statements
-        if table_name == 'UDF_Definitions' or 'CREATE FUNCTION' in sql.upper():
-            # Extract CREATE FUNCTION statements using regex (handles comments better)
-            udf_pattern = r'(CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+\w+\s*\([^)]*\)\s*RETURNS\s+\w+\s+RETURN\s+[^;]+)'
-            udf_statements = re.findall(udf_pattern, sql, flags=re.IGNORECASE | re.DOTALL)
+        if stmt_info['kind'] == 'udf':
+            udf_statements = stmt_info['udf_statements']
             
-            errors = []
-            for udf_sql in udf_statements:
-                udf_sql = udf_sql.strip()
-                if udf_sql:
-                    try:
-                        cursor.execute(udf_sql)
-                    except Exception as udf_error:
-                        # Collect errors but continue with other UDFs
-                        errors.append(str(udf_error)[:150])
+            # The UDFs don't depend on each other, so they are pipelined;
+            # errors are collected without stopping the other UDFs
+            errors = execute_pipelined(cursor, [udf_sql for udf_sql in udf_statements if udf_sql])
             
             if not udf_statements:
-                result['error'] = "No UDF statements found to execute"
-                result['success'] = False
+                error = "No UDF statements found to execute"
             elif errors:
-                result['error'] = '; '.join(errors)
-                result['success'] = False  
+                error = _error_text('; '.join(errors))
             else:
-                result['success'] = True
+                success = True
         else:
-            cursor.execute(sql)
-            result['success'] = True
+            cursor.execute(stmt_info['sql'])
+            success = True
     except Exception as e:
-        result['error'] = str(e)
-        result['success'] = False
+        error = _error_text(e)
+        success = False
     
-    return result
+    return StatementResult(stmt_info['table_name'], success, error)
 
 
-def cleanup_table(cursor, table_name: str):
-    """Drop a table or function if it exists."""
-    if table_name == 'UDF_Definitions':
-        # Drop commonly created UDFs
-        common_udfs = ['sentiment_score', 'normalize_text']
-        for udf in common_udfs:
-            try:
-                cursor.execute(f"DROP FUNCTION IF EXISTS {udf}")
-            except:
-                pass
-        return
-    try:
-        cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-    except:
-        pass
+# Commonly created UDFs, dropped in place of a file's UDF_Definitions
+COMMON_UDFS = ['sentiment_score', 'normalize_text']
+
 
+def cleanup_tables(connection, table_names: List[str]):
+    """Drop tables and UDFs if they exist, sending all the DROPs as one batch."""
+    tables = list(dict.fromkeys(name for name in table_names if name != 'UDF_Definitions'))
+    functions = COMMON_UDFS if 'UDF_Definitions' in table_names else []
+    if tables or functions:
+        drop_tables(connection, tables, functions)
 
-def test_sql_file(connection, file_path: Path, cleanup: bool = True) -> List[Dict]:
-    """Test all statements in a SQL file."""
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}Testing: {file_path.name}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+
+def statement_dependencies(statements: List[Dict]) -> List[Set[int]]:
+    """
+    Return, for each statement, the indexes of the earlier statements it must
+    wait for: those whose table it references, and any UDF definitions.
+    """
+    references = [
+        None if stmt_info['table_name'] == 'UDF_Definitions'
+        else re.compile(rf"\b{re.escape(stmt_info['table_name'])}\b", re.IGNORECASE)
+        for stmt_info in statements
+    ]
+    return [
+        {j for j in range(i) if references[j] is None or references[j].search(stmt_info['sql'])}
+        for i, stmt_info in enumerate(statements)
+    ]
+
+
+def run_statement(cursor, stmt_info: Dict, status: str, write: Callable = log) -> StatementResult:
+    """Execute one statement and report the outcome after its status prefix."""
+    # Execute the CREATE TABLE
+    result = execute_statement(cursor, stmt_info)
     
-    with open(file_path, 'r') as f:
-        sql_content = f.read()
+    if result.success:
+        write(f"{status} {Colors.GREEN}✓ Success{Colors.RESET}")
+    else:
+        write(f"{status} {Colors.RED}✗ Failed{Colors.RESET}\n"
+              f"  {Colors.RED}Error: {result.error}{Colors.RESET}")
+    return result
+
+
+def test_sql_file(connections: ThreadConnections, pool: CursorPool, file_path: Path, statements: List[Dict],
+                  cleanup: bool = True, write: Callable = log) -> List[StatementResult]:
+    """
+    Test all statements extracted from a SQL file. Each statement is started as
+    soon as the statements it depends on have finished, so independent ones run
+    concurrently on the pool, whose cursors are reused across files. Cleanup
+    runs on the calling thread's own connection. Output lines go to write.
+    """
+    write(f"\n{banner(Colors.CYAN, f'Testing: {file_path.name}')}\n")
     
-    statements = extract_create_statements(sql_content)
-    results = []
-    tables_created = []
+    results = [None] * len(statements)
+    connection = connections.get()
     
-    with connection.cursor() as cursor:
-        for i, stmt_info in enumerate(statements, 1):
-            table_name = stmt_info['table_name']
-            sql = stmt_info['sql']
-            
-            print(f"{Colors.YELLOW}[{i}/{len(statements)}] Testing: {table_name}{Colors.RESET}", end=" ")
-            
-            # Clean up first if table exists (from previous run)
-            cleanup_table(cursor, table_name)
-            
-            # Execute the CREATE TABLE
-            result = execute_statement(cursor, sql, table_name)
-            result['file'] = file_path.stem
-            results.append(result)
-            
-            if result['success']:
-                print(f"{Colors.GREEN}✓ Success{Colors.RESET}")
-                tables_created.append(table_name)
-            else:
-                print(f"{Colors.RED}✗ Failed{Colors.RESET}")
-                print(f"  {Colors.RED}Error: {result['error'][:200]}{Colors.RESET}")
+    # Clean up first if tables exist (from previous run)
+    cleanup_tables(connection, [stmt_info['table_name'] for stmt_info in statements])
+    
+    dependencies = statement_dependencies(statements)
+    # Progress prefix with the colors and total filled in once per file
+    progress = f"{Colors.YELLOW}[%d/{len(statements)}] Testing: %s{Colors.RESET}"
+    waiting = list(range(len(statements)))
+    running = {}
+    finished = set()
+    while waiting or running:
+        for i in [i for i in waiting if dependencies[i] <= finished]:
+            waiting.remove(i)
+            status = progress % (i + 1, statements[i]['table_name'])
+            running[pool.submit(run_statement, statements[i], status, write)] = i
         
-        # Clean up ALL tables from this file at the end (if cleanup requested)
-        if cleanup and tables_created:
-            print(f"\n{Colors.YELLOW}Cleaning up {len(tables_created)} table(s)...{Colors.RESET}")
-            for table_name in tables_created:
-                cleanup_table(cursor, table_name)
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = running.pop(future)
+            results[i] = future.result()._replace(file=file_path.stem)
+            finished.add(i)
+    
+    tables_created = [result.table_name for result in results if result.success]
+    
+    # Clean up ALL tables from this file at the end (if cleanup requested)
+    if cleanup and tables_created:
+        write(f"\n{Colors.YELLOW}Cleaning up {len(tables_created)} table(s)...{Colors.RESET}")
+        cleanup_tables(connection, tables_created)
     
     return results
 
 
-def print_summary(all_results: List[Dict]):
+def file_groups(file_statements: Dict[Path, List[Dict]]) -> List[List[Path]]:
+    """
+    Group files that create a table (or UDFs) of the same name, so they are
+    tested one after another; files in different groups touch disjoint objects.
+    """
+    groups = []
+    for file_path, statements in file_statements.items():
+        names = {stmt_info['table_name'] for stmt_info in statements}
+        files = [file_path]
+        for group in [group for group in groups if group[0] & names]:
+            groups.remove(group)
+            names |= group[0]
+            files = group[1] + files
+        groups.append((names, files))
+    return [sorted(files) for _, files in groups]
+
+
+def test_file_group(connections: ThreadConnections, pool: CursorPool, files: List[Path],
+                    file_statements: Dict[Path, List[Dict]], cleanup: bool = True) -> Dict[Path, List[StatementResult]]:
+    """
+    Test a group's files in order. Each file's output is collected and printed
+    in one piece when the file is done, so concurrent groups don't interleave.
+    """
+    results = {}
+    for file_path in files:
+        lines = []
+        try:
+            results[file_path] = test_sql_file(connections, pool, file_path, file_statements[file_path],
+                                               cleanup, lines.append)
+        finally:
+            log('\n'.join(lines))
+    return results
+
+
+def print_summary(all_results: List[StatementResult]):
     """Print summary of test results."""
     total = len(all_results)
-    passed = sum(1 for r in all_results if r['success'])
-    failed = sum(1 for r in all_results if not r['success'])
+    # One pass over the results; the counts and percentages follow from it
+    failed_results = [result for result in all_results if not result.success]
+    failed = len(failed_results)
+    passed = total - failed
+    pct_passed = 100.0 * passed / total if total else 0.0
+    pct_failed = 100.0 * failed / total if total else 0.0
     
-    print(f"\n{Colors.MAGENTA}{Colors.BOLD}{'='*80}{Colors.RESET}")
-    print(f"{Colors.MAGENTA}{Colors.BOLD}INTEGRATION TEST SUMMARY{Colors.RESET}")
-    print(f"{Colors.MAGENTA}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+    print(f"\n{banner(Colors.MAGENTA, 'INTEGRATION TEST SUMMARY')}\n")
     
     print(f"Total statements tested: {Colors.BOLD}{total}{Colors.RESET}")
-    print(f"Passed: {Colors.GREEN}{Colors.BOLD}{passed}{Colors.RESET} ({(passed/total)*100:.1f}%)")
-    print(f"Failed: {Colors.RED}{Colors.BOLD}{failed}{Colors.RESET} ({(failed/total)*100:.1f}%)\n")
+    print(f"Passed: {Colors.GREEN}{Colors.BOLD}{passed}{Colors.RESET} ({pct_passed:.1f}%)")
+    print(f"Failed: {Colors.RED}{Colors.BOLD}{failed}{Colors.RESET} ({pct_failed:.1f}%)\n")
     
-    if failed > 0:
-        print(f"{Colors.RED}{Colors.BOLD}Failed statements:{Colors.RESET}\n")
-        for result in all_results:
-            if not result['success']:
-                print(f"  {Colors.RED}✗ {result['file']} - {result['table_name']}{Colors.RESET}")
-                print(f"    Error: {result['error'][:150]}\n")
+    if failed_results:
+        lines = [f"{Colors.RED}{Colors.BOLD}Failed statements:{Colors.RESET}\n"]
+        for result in failed_results:
+            lines.append(f"  {Colors.RED}✗ {result.file} - {result.table_name}{Colors.RESET}\n"
+                         f"    Error: {result.error}\n")
+        print('\n'.join(lines))
     else:
         print(f"{Colors.GREEN}{Colors.BOLD}🎉 All statements executed successfully!{Colors.RESET}")
         print(f"{Colors.GREEN}Your SQL is production-ready for Databricks!{Colors.RESET}\n")
@@ -218,6 +358,8 @@ def main():
     WAREHOUSE_ID = os.getenv('DATABRICKS_WAREHOUSE_ID')
     SCHEMA = 'hql_test'  # Dedicated schema for migration testing
     CLEANUP_AFTER_TEST = True  # Set to False to keep tables for inspection
+    # Independent statements of a file run concurrently, up to this many at once
+    MAX_CONCURRENCY = int(os.getenv('DATABRICKS_MAX_CONCURRENCY', '8'))
     
     # Get paths
     script_dir = Path(__file__).parent.parent
@@ -239,9 +381,7 @@ def main():
         print(f"{Colors.YELLOW}Set it with: export DATABRICKS_WAREHOUSE_ID=your_warehouse_id{Colors.RESET}")
         return
     
-    print(f"{Colors.BLUE}{Colors.BOLD}{'='*80}{Colors.RESET}")
-    print(f"{Colors.BLUE}{Colors.BOLD}Integration Test: Execute Final SQL in Databricks{Colors.RESET}")
-    print(f"{Colors.BLUE}{Colors.BOLD}{'='*80}{Colors.RESET}")
+    print(banner(Colors.BLUE, 'Integration Test: Execute Final SQL in Databricks'))
     print(f"\n{Colors.CYAN}Found {len(sql_files)} SQL file(s) to test{Colors.RESET}")
     print(f"{Colors.YELLOW}Cleanup after test: {'Yes' if CLEANUP_AFTER_TEST else 'No'}{Colors.RESET}")
     
@@ -263,17 +403,22 @@ def main():
         server_hostname = host.replace('https://', '')
         http_path = f'/sql/1.0/warehouses/{WAREHOUSE_ID}'
         
-        connection = sql.connect(
-            server_hostname=server_hostname,
-            http_path=http_path,
-            access_token=token
-        )
-        print(f"{Colors.GREEN}✓ Connected successfully{Colors.RESET}")
+        def connect():
+            # The session opens in the dedicated schema, saving a USE SCHEMA round trip.
+            # Large results come back via cloud fetch, spelled out since older 3.x
+            # connectors left it off.
+            return sql.connect(
+                server_hostname=server_hostname,
+                http_path=http_path,
+                access_token=token,
+                schema=SCHEMA,
+                use_cloud_fetch=True
+            )
         
-        # Use dedicated schema
-        cursor = connection.cursor()
-        cursor.execute(f'USE SCHEMA {SCHEMA}')
-        cursor.close()
+        connection = connect()
+        # Worker threads get connections of their own; this one stays with the main thread
+        connections = ThreadConnections(connect, connection)
+        print(f"{Colors.GREEN}✓ Connected successfully{Colors.RESET}")
         print(f"{Colors.CYAN}Using schema: {SCHEMA}{Colors.RESET}")
         
     except Exception as e:
@@ -282,29 +427,38 @@ def main():
     
     # Generate sample data FIRST (base tables must exist!)
     print(f"\n{Colors.CYAN}{Colors.BOLD}Step 1: Generating sample data...{Colors.RESET}")
-    generate_script = Path(__file__).parent / 'generate_sample_data.py'
     try:
-        result = subprocess.run(
-            [sys.executable, str(generate_script)],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        # Runs in-process on these connections rather than as a separate script
+        if not generate_sample_data.run(connections, MAX_CONCURRENCY):
+            raise RuntimeError("not every sample table was loaded")
         print(f"{Colors.GREEN}✓ Sample data generated successfully{Colors.RESET}\n")
-    except subprocess.CalledProcessError as e:
-        print(f"{Colors.RED}✗ Failed to generate sample data:{Colors.RESET}")
-        print(e.stdout)
-        print(e.stderr)
+    except Exception as e:
+        print(f"{Colors.RED}✗ Failed to generate sample data: {e}{Colors.RESET}")
+        connections.close()
+        connection.close()
         return
     
     # Test all SQL files
     print(f"{Colors.CYAN}{Colors.BOLD}Step 2: Testing converted SQL...{Colors.RESET}\n")
     all_results = []
     try:
+        file_statements = {sql_file: read_statements(sql_file) for sql_file in sql_files}
+        groups = file_groups(file_statements)
+        file_results = {}
+        # Files with disjoint tables are tested concurrently, sharing the cursor pool;
+        # every thread, group or pool worker, uses its own connection
+        with CursorPool(connections, MAX_CONCURRENCY) as pool, \
+                ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = [
+                executor.submit(test_file_group, connections, pool, group, file_statements, CLEANUP_AFTER_TEST)
+                for group in groups
+            ]
+            for future in futures:
+                file_results.update(future.result())
         for sql_file in sql_files:
-            file_results = test_sql_file(connection, sql_file, CLEANUP_AFTER_TEST)
-            all_results.extend(file_results)
+            all_results.extend(file_results[sql_file])
     finally:
+        connections.close()
         if connection:
             connection.close()
             print(f"\n{Colors.YELLOW}Connection closed{Colors.RESET}")
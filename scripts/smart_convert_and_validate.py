@@ -10,16 +10,31 @@ Strategy:
 Auto-fixes:
 - CLUSTERED BY in CREATE TABLE AS SELECT (not supported in Databricks)
 
+HQL files are processed concurrently (HQL_FILE_WORKERS, default 4).
+Validated AI conversions are cached in spark_sql_final/ai_conversion_cache.db
+and reused for identical statements (ignoring whitespace and keyword case).
+
 AI Model: databricks-claude-sonnet-4-5 (Claude Sonnet 4.5)
 """
 
+import io
 import os
 import re
-import configparser
+import sys
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Any, List, Dict, Tuple, Optional, TextIO
 from databricks import sql
 from databricks.sql.client import Connection
+from _common import ThreadConnections, normalize_hql, read_databricks_config, submit_query
+
+try:
+    import re2  # google-re2: linear-time matching, no backtracking
+except ImportError:
+    re2 = None
 
 # ANSI color codes for terminal output
 class Colors:
@@ -33,60 +48,96 @@ class Colors:
     BOLD = '\033[1m'
 
 
-def read_databricks_config(profile: str = 'DEFAULT') -> Tuple[str, str]:
-    """Read Databricks configuration from .databrickscfg file."""
-    config_path = Path.home() / '.databrickscfg'
-    
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-    
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    
-    if profile not in config:
-        raise ValueError(f"Profile '{profile}' not found in {config_path}")
-    
-    host = config[profile]['host'].strip()
-    token = config[profile]['token'].strip()
-    
-    return host, token
-
-
-def extract_udf_definitions(sql_content: str) -> Tuple[List[str], str]:
+def compile_linear(pattern: str):
     """
-    Extract UDF definitions from SQL content.
-    Returns (list_of_udf_definitions, sql_without_udfs).
+    Compile a pattern with RE2 when google-re2 is installed, so matching time
+    is linear in the input however the pattern could backtrack; otherwise
+    with re. Flags must be given inline, e.g. (?is).
     """
-    udf_defs = []
-    lines = sql_content.split('\n')
-    cleaned_lines = []
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except Exception:
+            pass  # Syntax RE2 doesn't support
+    return re.compile(pattern)
+
+
+# Statement extraction patterns
+# Whole Hive UDF lines (with their newline): ADD JAR and CREATE TEMPORARY FUNCTION
+_HIVE_UDF_LINE_RE = re.compile(
+    r'^(?:(?P<jar>[^\S\n]*ADD JAR)|(?i:[^\n]*CREATE TEMPORARY FUNCTION))[^\n]*(?:\n|\Z)', re.MULTILINE)
+_TEMP_FUNCTION_RE = re.compile(r'CREATE\s+TEMPORARY\s+FUNCTION\s+(\w+)', re.IGNORECASE)
+_SET_RE = re.compile(r'^SET\s+[^\n]+;?\s*$', re.MULTILINE | re.IGNORECASE)
+_BLANK_LINES_RE = re.compile(r'\n\n\n+')
+_COMMENT_RE = re.compile(r'--[^\n]*')
+_CREATE_SPLIT_RE = re.compile(r'\n(?=CREATE\s+TABLE)', re.IGNORECASE)
+_TABLE_NAME_RE = re.compile(r'CREATE\s+TABLE\s+(\w+)', re.IGNORECASE)
+
+# CLUSTERED BY inside CREATE TABLE ... AS SELECT (the CTAS check's .* spans
+# the whole statement, so it uses RE2 when available)
+_CTAS_RE = compile_linear(r'(?is)CREATE\s+TABLE.*AS\s+SELECT')
+_CLUSTERED_RE = re.compile(r'CLUSTERED BY \([^)]+\) INTO \d+ BUCKETS', re.IGNORECASE)
+
+# SELECT body of a CREATE TABLE ... AS SELECT (AS and SELECT may be on separate lines)
+_AS_SELECT_RE = re.compile(r'\bAS\s+(SELECT\b.*)', re.IGNORECASE | re.DOTALL)
+
+# Case-insensitive keyword checks, searched in place instead of upper-casing the query
+_HAS_AS_SELECT_RE = re.compile(r'AS[ \n]SELECT', re.IGNORECASE)
+_CREATE_FUNCTION_RE = re.compile(r'CREATE (?:OR REPLACE )?FUNCTION', re.IGNORECASE)
+
+# Markdown code fences (opening or closing) around an AI_QUERY response
+_MD_FENCE_RE = re.compile(r'^```sql\s*|```\s*$', re.MULTILINE)
+
+# apply_auto_fixes patterns. Fixes that rewrite independent clauses share one
+# alternation per stage, so each stage is a single scan; every alternative is
+# a named group and maps to the note recorded when it fires (in report order).
+_CLAUSE_FIX_NOTES = {
+    'partitioned': "Removed PARTITIONED BY from CTAS (use ALTER TABLE to add partitioning after creation)",
+    'clustered': "Removed CLUSTERED BY (with optional SORTED BY) from CTAS",
+    'join_hint': "Removed Hive hints from JOIN ON clause",
+    'tablesample': "Removed TABLESAMPLE clause, kept main table alias",
+    'streamtable': "Removed STREAMTABLE hint",
+}
+_CLAUSE_FIXES_RE = re.compile('|'.join([
+    r'(?P<partitioned>(?i:PARTITIONED BY \([^)]+\)\s*\n))',
+    r'(?P<clustered>CLUSTERED BY \([^)]+\)(?:\s+SORTED BY \([^)]+\))?\s+INTO \d+ BUCKETS\s*\n)',
+    r'(?P<join_hint>(?i:(?P<join_on>ON\s+[^\s]+\s*=\s*[^\s]+)\s*/\*\+[^*]+\*/(?P<join_space>\s*)))',
+    r'(?P<tablesample>(?i:(?P<sample_from>FROM\s+\w+\s+)(?P<sample_alias>\w+)\s+TABLESAMPLE\s*\([^)]+\)\s+\w+(?P<sample_end>\s*\n)))',
+    r'(?P<streamtable>(?i:/\*\+\s*STREAMTABLE\s*\([^)]+\)\s*\*/))',
+]))
+_FORMAT_FIX_NOTES = {
+    'using_format': "Changed USING PARQUET/ORC to USING ICEBERG (managed Iceberg tables)",
+    'stored_as': "Changed STORED AS ORC/PARQUET to USING ICEBERG",
+    'tblproperties': "Changed TBLPROPERTIES to OPTIONS",
+}
+_FORMAT_FIXES_RE = re.compile('|'.join([
+    r'(?P<using_format>USING\s+(?:PARQUET|ORC))',
+    r'(?P<stored_as>STORED\s+AS\s+(?:ORC|PARQUET))',
+    r'(?P<tblproperties>TBLPROPERTIES\s*\((?P<properties>[^)]+)\))',
+]), re.IGNORECASE)
+_DIST_RE = re.compile(r'DISTRIBUTE\s+BY\s+([\w,\s]+?)(?:\s+SORT\s+BY\s+([\w,\s]+?))?(?:;|\s*$)', re.IGNORECASE)
+_CREATE_AS_RE = re.compile(r'(CREATE TABLE \w+)((?:\s+USING \w+)?(?:\s+OPTIONS \([^)]+\))?)\s+(AS)(?:\s+)(SELECT)',
+                           re.IGNORECASE | re.DOTALL)
+# MAP() mixing aggregates and window functions; the nested lazy .*? can
+# backtrack heavily on long statements, so these use RE2 when available
+_MAP_WINDOW_RE = compile_linear(r"(?is)MAP\s*\([^)]*?FIRST_VALUE[^)]*?OVER[^)]+?\)[^)]*?\)")
+_MAP_WINDOW_COLUMN_RE = compile_linear(r'(?is)(,\s*MAP\s*\([^)]*?FIRST_VALUE.*?OVER.*?\).*?\)\s+as\s+\w+)')
+
+
+def udf_placeholder(func_name: str) -> str:
+    """Databricks SQL UDF placeholder standing in for a Hive (Java) UDF."""
+    # Determine return type based on function name
+    if 'text' in func_name.lower() or 'normalize' in func_name.lower():
+        return_type = 'STRING'
+        return_value = 'LOWER(TRIM(text))'
+        comment = 'Placeholder: returns lowercased, trimmed text'
+    else:
+        return_type = 'DOUBLE'
+        return_value = '0.5'
+        comment = 'Placeholder: returns neutral sentiment'
     
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # Check for Hive UDF patterns
-        if line.startswith('ADD JAR'):
-            # Skip ADD JAR lines (not needed in Databricks)
-            i += 1
-            continue
-        elif 'CREATE TEMPORARY FUNCTION' in line.upper():
-            # Extract UDF definition - convert to Databricks SQL UDF placeholder
-            func_match = re.search(r'CREATE\s+TEMPORARY\s+FUNCTION\s+(\w+)', line, re.IGNORECASE)
-            if func_match:
-                func_name = func_match.group(1)
-                # Determine return type based on function name
-                if 'text' in func_name.lower() or 'normalize' in func_name.lower():
-                    return_type = 'STRING'
-                    return_value = 'LOWER(TRIM(text))'
-                    comment = 'Placeholder: returns lowercased, trimmed text'
-                else:
-                    return_type = 'DOUBLE'
-                    return_value = '0.5'
-                    comment = 'Placeholder: returns neutral sentiment'
-                
-                # Create a placeholder SQL UDF
-                udf_def = f"""-- TODO: Implement {func_name} UDF in Databricks
+    # Create a placeholder SQL UDF
+    return f"""-- TODO: Implement {func_name} UDF in Databricks
 -- Original was a Java UDF. Options:
 -- 1. Keep this SQL UDF placeholder
 -- 2. Create Python UDF in notebook
@@ -94,14 +145,27 @@ def extract_udf_definitions(sql_content: str) -> Tuple[List[str], str]:
 CREATE OR REPLACE FUNCTION {func_name}(text STRING)
 RETURNS {return_type}
 RETURN {return_value}; -- {comment}"""
-                udf_defs.append(udf_def)
-            i += 1
-            continue
-        
-        cleaned_lines.append(lines[i])
-        i += 1
+
+
+def extract_udf_definitions(sql_content: str) -> Tuple[List[str], str]:
+    """
+    Extract UDF definitions from SQL content.
+    Returns (list_of_udf_definitions, sql_without_udfs).
+    """
+    func_names: List[str] = []
+    
+    def drop_line(match: re.Match) -> str:
+        # ADD JAR lines are not needed in Databricks; CREATE TEMPORARY FUNCTION
+        # lines become Databricks SQL UDF placeholders
+        if match.group('jar') is None:
+            func_match = _TEMP_FUNCTION_RE.search(match.group())
+            if func_match:
+                func_names.append(func_match.group(1))
+        return ''
     
-    return udf_defs, '\n'.join(cleaned_lines)
+    # Drop the Hive UDF lines in a single scan
+    cleaned_sql = _HIVE_UDF_LINE_RE.sub(drop_line, sql_content)
+    return [udf_placeholder(func_name) for func_name in func_names], cleaned_sql
 
 
 def extract_statements(sql_content: str) -> List[Dict[str, str]]:
@@ -110,26 +174,17 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
     udf_defs, sql_content = extract_udf_definitions(sql_content)
     
     # Remove SET commands at the file level (before splitting into statements)
-    set_pattern = r'^SET\s+[^\n]+;?\s*$'
-    sql_content = re.sub(set_pattern, '', sql_content, flags=re.MULTILINE | re.IGNORECASE)
-    sql_content = re.sub(r'\n\n\n+', '\n\n', sql_content)  # Clean up blank lines
-    
-    # Remove single-line comments but preserve the SQL
-    lines = sql_content.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        if '--' in line:
-            cleaned_lines.append(line.split('--')[0])
-        else:
-            cleaned_lines.append(line)
+    sql_content = _SET_RE.sub('', sql_content)
+    sql_content = _BLANK_LINES_RE.sub('\n\n', sql_content)  # Clean up blank lines
     
-    sql_content = '\n'.join(cleaned_lines)
+    # Remove single-line comments but keep the line structure
+    sql_content = _COMMENT_RE.sub('', sql_content)
     
     # Split on CREATE TABLE
-    statements = re.split(r'\n(?=CREATE\s+TABLE)', sql_content, flags=re.IGNORECASE)
+    statements = _CREATE_SPLIT_RE.split(sql_content)
     
     # Clean up and filter empty statements
-    result = []
+    result: List[Dict[str, str]] = []
     
     # Add UDF definitions as the first "statement" if any exist
     if udf_defs:
@@ -142,7 +197,7 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
         stmt = stmt.strip()
         if stmt:
             # Extract table name
-            table_match = re.search(r'CREATE\s+TABLE\s+(\w+)', stmt, re.IGNORECASE)
+            table_match = _TABLE_NAME_RE.search(stmt)
             table_name = table_match.group(1) if table_match else "Unknown"
             result.append({
                 'table_name': table_name,
@@ -154,20 +209,25 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
 
 def has_clustered_by_in_ctas(query: str) -> bool:
     """Check if query has CLUSTERED BY in a CTAS statement."""
+    # Most statements have no CLUSTERED BY at all; a substring test rules
+    # them out before either regex scans the statement
+    if 'CLUSTERED BY' not in query.upper():
+        return False
+    
     # Check if it's a CTAS (has both CREATE TABLE and AS SELECT)
-    is_ctas = bool(re.search(r'CREATE\s+TABLE.*AS\s+SELECT', query, flags=re.IGNORECASE | re.DOTALL))
+    is_ctas = bool(_CTAS_RE.search(query))
     
     # Check if it has CLUSTERED BY
-    has_clustered = bool(re.search(r'CLUSTERED BY \([^)]+\) INTO \d+ BUCKETS', query, flags=re.IGNORECASE))
+    has_clustered = bool(_CLUSTERED_RE.search(query))
     
     return is_ctas and has_clustered
 
 
-def try_original_query(connection: Connection, query: str, table_name: str) -> Dict:
+def check_original_query(query: str, table_name: str) -> Tuple[Dict, Optional[str]]:
     """
-    Try to validate the original HQL query with EXPLAIN.
-    Also checks for known issues that need auto-fixing.
-    Returns success/failure status.
+    Start validating an original HQL query: settle the cases that need no
+    warehouse round trip (UDF definitions, known auto-fixable issues).
+    Returns the result and the EXPLAIN statement still to run, if any.
     """
     result = {
         'table_name': table_name,
@@ -179,37 +239,61 @@ def try_original_query(connection: Connection, query: str, table_name: str) -> D
     }
     
     # Skip validation for UDF definitions - they'll be executed directly
-    if table_name == 'UDF_Definitions' or 'CREATE FUNCTION' in query.upper() or 'CREATE OR REPLACE FUNCTION' in query.upper():
+    if table_name == 'UDF_Definitions' or _CREATE_FUNCTION_RE.search(query):
         result['original_works'] = True
         result['explain_output'] = "UDF definition - will be executed directly"
-        return result
+        return result, None
     
     # Check for CLUSTERED BY in CTAS (can be auto-fixed)
     if has_clustered_by_in_ctas(query):
         result['needs_auto_fix'] = True
         result['auto_fix_reason'] = "CLUSTERED BY not supported in CTAS"
         result['original_works'] = False
+        return result, None
+    
+    # Extract SELECT portion for EXPLAIN
+    if _HAS_AS_SELECT_RE.search(query):
+        match = _AS_SELECT_RE.search(query)
+        if not match:
+            return result, None
+        select_statement = match.group(1).rstrip(';').strip()
+        return result, f"EXPLAIN {select_statement}"
+    
+    # Try to explain the whole thing
+    return result, f"EXPLAIN {query.rstrip(';')}"
+
+
+# Plan lines kept in explain_output; only these are fetched from the warehouse
+EXPLAIN_OUTPUT_ROWS = 5
+
+
+def record_explain(result: Dict, explain_results: list):
+    """Mark a query as valid and keep the start of its EXPLAIN plan."""
+    result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:EXPLAIN_OUTPUT_ROWS]])
+    result['original_works'] = True
+
+
+def collect_explain(cursor) -> list:
+    """Wait for an EXPLAIN started with submit_query and fetch the first plan lines."""
+    if hasattr(cursor, 'execute_async'):
+        cursor.get_async_execution_result()
+    return cursor.fetchmany(EXPLAIN_OUTPUT_ROWS)
+
+
+def try_original_query(connection: Connection, query: str, table_name: str) -> Dict:
+    """
+    Try to validate the original HQL query with EXPLAIN.
+    Also checks for known issues that need auto-fixing.
+    Returns success/failure status.
+    """
+    result, explain_query = check_original_query(query, table_name)
+    if explain_query is None:
         return result
     
     try:
         with connection.cursor() as cursor:
-            # Extract SELECT portion for EXPLAIN
-            if 'AS SELECT' in query.upper() or 'AS\nSELECT' in query.upper():
-                match = re.search(r'\bAS\s+(SELECT\b.*)', query, flags=re.IGNORECASE | re.DOTALL)
-                if match:
-                    select_statement = match.group(1).rstrip(';').strip()
-                    explain_query = f"EXPLAIN {select_statement}"
-                    cursor.execute(explain_query)
-                    explain_results = cursor.fetchall()
-                    result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:5]])
-                    result['original_works'] = True
-            else:
-                # Try to explain the whole thing
-                explain_query = f"EXPLAIN {query.rstrip(';')}"
-                cursor.execute(explain_query)
-                explain_results = cursor.fetchall()
-                result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:5]])
-                result['original_works'] = True
+            cursor.execute(explain_query)
+            record_explain(result, cursor.fetchmany(EXPLAIN_OUTPUT_ROWS))
                 
     except Exception as e:
         result['error'] = str(e)
@@ -218,30 +302,57 @@ def try_original_query(connection: Connection, query: str, table_name: str) -> D
     return result
 
 
-def convert_with_ai(connection: Connection, query: str, table_name: str, error_msg: str) -> Dict:
+def try_original_queries(connection: Connection, statements: List[Dict[str, str]],
+                         batch_size: int = 16) -> List[Dict]:
     """
-    Use AI_QUERY to convert HQL to Spark SQL.
+    Validate many original HQL queries, like try_original_query.
+    The EXPLAINs of each batch are all submitted, each on its own cursor,
+    before any of them is awaited, so a batch costs about one round trip.
     """
-    result = {
-        'converted_sql': None,
-        'conversion_error': None,
-        'validation_works': False,
-        'validation_error': None
-    }
-    
-    # Escape single quotes for AI_QUERY
-    escaped_query = query.replace("'", "''")
-    
-    # Truncate if too long
-    if len(escaped_query) > 3000:
-        escaped_query = escaped_query[:3000]
+    results: List[Dict] = []
+    for start in range(0, len(statements), batch_size):
+        checks = [check_original_query(stmt_info['sql'], stmt_info['table_name'])
+                  for stmt_info in statements[start:start + batch_size]]
+        # Statements still to EXPLAIN, each with its own cursor
+        pending = [(result, explain_query, connection.cursor())
+                   for result, explain_query in checks if explain_query is not None]
+        try:
+            errors = [submit_query(cursor, explain_query) for _, explain_query, cursor in pending]
+            
+            for (result, _, cursor), error in zip(pending, errors):
+                if error is None:
+                    try:
+                        record_explain(result, collect_explain(cursor))
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    result['error'] = str(error)
+                    result['original_works'] = False
+        finally:
+            for _, _, cursor in pending:
+                cursor.close()
+        
+        results.extend(result for result, _ in checks)
     
-    try:
-        with connection.cursor() as cursor:
-            # Use AI_QUERY to convert
-            conversion_prompt = f"""You are a SQL converter. Convert this HiveQL to Databricks Spark SQL.
+    return results
+
+
+AI_MODEL = 'databricks-claude-sonnet-4-5'
+
+# Bump whenever the conversion prompt changes so cached conversions are invalidated
+PROMPT_VERSION = '1'
 
-ERROR: {error_msg[:200]}
+# AI_QUERY input limits (characters of the failure message and of HQL)
+MAX_ERROR_CHARS = 200
+MAX_HQL_CHARS = 3000
+
+# The conversion prompt is CONVERSION_PROMPT_PREFIX + error + CONVERSION_PROMPT_RULES
+# + HQL + CONVERSION_PROMPT_SUFFIX; the fixed parts are built once per process
+CONVERSION_PROMPT_PREFIX = """You are a SQL converter. Convert this HiveQL to Databricks Spark SQL.
+
+ERROR: """
+
+CONVERSION_PROMPT_RULES = """
 
 CRITICAL RULES:
 - Return ONLY executable SQL code
@@ -256,44 +367,160 @@ CRITICAL RULES:
   * Remove CLUSTERED BY from CTAS
 
 INPUT HQL:
-{escaped_query}
+"""
 
-OUTPUT (SQL only):"""
+CONVERSION_PROMPT_SUFFIX = """
 
-            # Escape the entire prompt for SQL string
-            escaped_prompt = conversion_prompt.replace("'", "''")
+OUTPUT (SQL only):"""
 
-            ai_query = f"""
+AI_QUERY_SQL = f"""
             SELECT AI_QUERY(
-                'databricks-claude-sonnet-4-5',
-                '{escaped_prompt}'
+                '{AI_MODEL}',
+                :prompt
             ) as converted_sql
             """
-            
-            cursor.execute(ai_query)
+
+
+class ConversionCache:
+    """
+    Persistent on-disk cache of validated AI_QUERY conversions.
+    Entries are keyed by a BLAKE2b hash of the normalized HQL (see
+    normalize_hql), model and prompt version, so statements repeated across
+    files or runs only pay for one AI_QUERY call.
+    """
+    
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS conversions (
+                input_hash TEXT PRIMARY KEY,
+                converted_sql TEXT
+            )
+        """)
+        self._db.commit()
+    
+    @staticmethod
+    def key(query: str) -> str:
+        """Cache key for an HQL statement under the current model and prompt."""
+        material = f"{PROMPT_VERSION}\n{AI_MODEL}\n{normalize_hql(query)}"
+        return hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def get(self, query: str) -> Optional[str]:
+        """Return the cached conversion for an HQL statement, if any."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT converted_sql FROM conversions WHERE input_hash = ?", (self.key(query),)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def put(self, query: str, converted_sql: str):
+        """Store a conversion that passed validation."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversions VALUES (?, ?)", (self.key(query), converted_sql)
+            )
+            self._db.commit()
+    
+    def close(self):
+        """Close the cache database."""
+        with self._lock:
+            self._db.close()
+
+
+class StatementResults:
+    """
+    In-memory memo of process_query results, shared by the file workers.
+    Entries are keyed by a BLAKE2b hash of the exact statement, so a statement
+    repeated across files is validated (and converted) only once per run.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[str, Dict] = {}
+    
+    @staticmethod
+    def key(query: str) -> str:
+        """Memo key for a statement."""
+        return hashlib.blake2b(query.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def get(self, query: str) -> Optional[Dict]:
+        """Return a copy of the stored result for a statement, if any."""
+        with self._lock:
+            result = self._results.get(self.key(query))
+        return dict(result) if result is not None else None
+    
+    def put(self, query: str, result: Dict):
+        """Store the result of processing a statement."""
+        with self._lock:
+            self._results[self.key(query)] = dict(result)
+
+
+def request_conversion(connection: Connection, query: str, error_msg: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Ask AI_QUERY to convert an HQL statement.
+    Returns (converted_sql, error) - exactly one of them is None.
+    """
+    # The prompt is a bound parameter, so neither the HQL nor the error needs
+    # quote escaping; only the variable pieces are sliced and joined per call
+    conversion_prompt = ''.join([
+        CONVERSION_PROMPT_PREFIX,
+        (error_msg or '')[:MAX_ERROR_CHARS],
+        CONVERSION_PROMPT_RULES,
+        query[:MAX_HQL_CHARS],  # Truncate if too long
+        CONVERSION_PROMPT_SUFFIX
+    ])
+    
+    try:
+        with connection.cursor() as cursor:
+            # Use AI_QUERY to convert
+            cursor.execute(AI_QUERY_SQL, {'prompt': conversion_prompt})
             ai_result = cursor.fetchone()
             
             if ai_result and ai_result[0]:
                 converted_sql = ai_result[0]
                 # Clean up the response (remove markdown if present)
-                converted_sql = re.sub(r'^```sql\s*', '', converted_sql, flags=re.MULTILINE)
-                converted_sql = re.sub(r'```\s*$', '', converted_sql, flags=re.MULTILINE)
-                result['converted_sql'] = converted_sql.strip()
-            else:
-                result['conversion_error'] = "AI_QUERY returned empty result"
-                return result
+                converted_sql = _MD_FENCE_RE.sub('', converted_sql)
+                return converted_sql.strip(), None
+            
+            return None, "AI_QUERY returned empty result"
                 
     except Exception as e:
-        result['conversion_error'] = f"AI_QUERY conversion failed: {str(e)}"
-        return result
+        return None, f"AI_QUERY conversion failed: {str(e)}"
+
+
+def convert_with_ai(connection: Connection, query: str, table_name: str, error_msg: str,
+                    cache: Optional[ConversionCache] = None) -> Dict:
+    """
+    Use AI_QUERY to convert HQL to Spark SQL.
+    A conversion found in the cache is validated again but not re-requested.
+    """
+    result: Dict[str, Any] = {
+        'converted_sql': None,
+        'conversion_error': None,
+        'validation_works': False,
+        'validation_error': None,
+        'from_cache': False
+    }
+    
+    cached_sql = cache.get(query) if cache else None
+    if cached_sql:
+        result['converted_sql'] = cached_sql
+        result['from_cache'] = True
+    else:
+        converted_sql, conversion_error = request_conversion(connection, query, error_msg)
+        if conversion_error:
+            result['conversion_error'] = conversion_error
+            return result
+        result['converted_sql'] = converted_sql
     
     # Validate the converted SQL with EXPLAIN
     try:
         with connection.cursor() as cursor:
             converted_sql = result['converted_sql']
             
-            if 'AS SELECT' in converted_sql.upper() or 'AS\nSELECT' in converted_sql.upper():
-                match = re.search(r'\bAS\s+(SELECT\b.*)', converted_sql, flags=re.IGNORECASE | re.DOTALL)
+            if _HAS_AS_SELECT_RE.search(converted_sql):
+                match = _AS_SELECT_RE.search(converted_sql)
                 if match:
                     select_statement = match.group(1).rstrip(';').strip()
                     explain_query = f"EXPLAIN {select_statement}"
@@ -308,130 +535,135 @@ OUTPUT (SQL only):"""
         result['validation_error'] = f"Converted SQL validation failed: {str(validation_error)}"
         result['validation_works'] = False
     
+    # Only conversions that validate are worth reusing
+    if cache and result['validation_works'] and not result['from_cache']:
+        cache.put(query, result['converted_sql'])
+    
     return result
 
 
-def apply_auto_fixes(sql: str) -> tuple[str, list]:
+def _rewrite_clause(match: re.Match) -> str:
+    """Replacement for one _CLAUSE_FIXES_RE or _FORMAT_FIXES_RE match."""
+    fix = match.lastgroup
+    if fix == 'join_hint':
+        return match.group('join_on') + match.group('join_space')
+    if fix == 'tablesample':
+        return match.group('sample_from') + match.group('sample_alias') + match.group('sample_end')
+    if fix in ('using_format', 'stored_as'):
+        return 'USING ICEBERG'
+    if fix == 'tblproperties':
+        return f"OPTIONS ({match.group('properties')})"
+    return ''
+
+
+def apply_fix_stage(sql: str, pattern: re.Pattern, notes: Dict[str, str]) -> Tuple[str, List[str]]:
+    """
+    Apply one stage of independent fixes in a single scan.
+    Returns (fixed_sql, notes of the fixes that fired, in report order).
+    """
+    fired = set()
+    
+    def rewrite(match: re.Match) -> str:
+        fired.add(match.lastgroup)
+        return _rewrite_clause(match)
+    
+    fixed_sql = pattern.sub(rewrite, sql)
+    return fixed_sql, [note for fix, note in notes.items() if fix in fired]
+
+
+def apply_auto_fixes(sql: str) -> Tuple[str, List[str]]:
     """
     Apply automatic fixes for common Hive-to-Spark issues.
     Returns (fixed_sql, list_of_fixes_applied).
     """
-    fixes_applied = []
-    fixed_sql = sql
+    fixes_applied: List[str] = []
+    fixed_sql: str = sql
+    # Most statements need no fixes, so each fix is gated on a keyword it
+    # requires; sql_upper is refreshed only after a fix changes the SQL
+    sql_upper = fixed_sql.upper()
     
     # Fix 0: Remove Hive SET commands
     # Pattern: SET hive.* or SET mapreduce.* or SET spark.* (at start of lines)
-    set_pattern = r'^SET\s+[^\n]+;?\s*$'
-    set_matches = re.findall(set_pattern, fixed_sql, flags=re.MULTILINE | re.IGNORECASE)
-    if set_matches:
-        fixed_sql = re.sub(set_pattern, '', fixed_sql, flags=re.MULTILINE | re.IGNORECASE)
+    set_count = 0
+    if 'SET' in sql_upper:
+        fixed_sql, set_count = _SET_RE.subn('', fixed_sql)
+    if set_count:
         # Clean up multiple blank lines left behind
-        fixed_sql = re.sub(r'\n\n\n+', '\n\n', fixed_sql)
-        fixes_applied.append(f"Removed {len(set_matches)} SET command(s) (Hive/MapReduce config not needed in Databricks)")
-    
-    # Fix 1: Remove PARTITIONED BY from CTAS (not supported in Databricks CTAS)
-    # Pattern: PARTITIONED BY (col1, col2)
-    pattern = r'PARTITIONED BY \([^)]+\)\s*\n'
-    if re.search(pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(pattern, '', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Removed PARTITIONED BY from CTAS (use ALTER TABLE to add partitioning after creation)")
-    
-    # Fix 2: Remove CLUSTERED BY from CTAS
-    # Pattern matches: CLUSTERED BY (...) SORTED BY (...) INTO N BUCKETS
-    pattern = r'CLUSTERED BY \([^)]+\)(?:\s+SORTED BY \([^)]+\))?\s+INTO \d+ BUCKETS\s*\n'
-    if re.search(pattern, fixed_sql):
-        fixed_sql = re.sub(pattern, '', fixed_sql)
-        fixes_applied.append("Removed CLUSTERED BY (with optional SORTED BY) from CTAS")
-    
-    # Fix 2: Remove Hive hints in wrong position (after ON clause)
-    # Pattern: ON ... /*+ HINT */ - preserve newlines
-    pattern = r'(ON\s+[^\s]+\s*=\s*[^\s]+)\s*/\*\+[^*]+\*/(\s*)'
-    if re.search(pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(pattern, r'\1\2', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Removed Hive hints from JOIN ON clause")
-    
-    # Fix 3: Remove TABLESAMPLE but preserve main table alias and formatting
-    # Pattern: FROM table alias TABLESAMPLE(...) sample_alias
-    pattern = r'(FROM\s+\w+\s+)(\w+)\s+TABLESAMPLE\s*\([^)]+\)\s+\w+(\s*\n)'
-    match = re.search(pattern, fixed_sql, flags=re.IGNORECASE)
-    if match:
-        # Keep the main table alias, remove TABLESAMPLE and its alias, preserve newline
-        replacement = r'\1\2\3'
-        fixed_sql = re.sub(pattern, replacement, fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Removed TABLESAMPLE clause, kept main table alias")
-    
-    # Fix 4: Remove STREAMTABLE hint
-    pattern = r'/\*\+\s*STREAMTABLE\s*\([^)]+\)\s*\*/'
-    if re.search(pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(pattern, '', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Removed STREAMTABLE hint")
+        fixed_sql = _BLANK_LINES_RE.sub('\n\n', fixed_sql)
+        sql_upper = fixed_sql.upper()
+        fixes_applied.append(f"Removed {set_count} SET command(s) (Hive/MapReduce config not needed in Databricks)")
+    
+    # Fixes 1-4, in one scan:
+    # - Remove PARTITIONED BY (col1, col2) from CTAS (not supported in Databricks CTAS)
+    # - Remove CLUSTERED BY (...) [SORTED BY (...)] INTO N BUCKETS from CTAS
+    # - Remove Hive hints in wrong position (ON ... /*+ HINT */), preserving newlines
+    # - Remove TABLESAMPLE (FROM table alias TABLESAMPLE(...) sample_alias), keeping
+    #   the main table alias and formatting
+    # - Remove STREAMTABLE hint
+    if ('PARTITIONED' in sql_upper or 'CLUSTERED BY' in sql_upper
+            or '/*+' in sql_upper or 'TABLESAMPLE' in sql_upper):
+        fixed_sql, notes = apply_fix_stage(fixed_sql, _CLAUSE_FIXES_RE, _CLAUSE_FIX_NOTES)
+        if notes:
+            sql_upper = fixed_sql.upper()
+            fixes_applied.extend(notes)
     
     # Fix 5: Remove DISTRIBUTE BY + SORT BY and add CLUSTER BY to table definition
     # First, extract DISTRIBUTE BY columns to use for CLUSTER BY
-    cluster_cols = None
-    dist_pattern = r'DISTRIBUTE\s+BY\s+([\w,\s]+?)(?:\s+SORT\s+BY\s+([\w,\s]+?))?(?:;|\s*$)'
-    dist_match = re.search(dist_pattern, fixed_sql, flags=re.IGNORECASE)
+    cluster_cols: Optional[str] = None
+    dist_match = _DIST_RE.search(fixed_sql) if 'DISTRIBUTE' in sql_upper else None
     if dist_match:
         dist_cols = dist_match.group(1).strip()
-        # Clean up and get unique columns
-        cluster_cols = ', '.join(set(c.strip() for c in dist_cols.split(',')))
+        # Clean up and get unique columns, in their DISTRIBUTE BY order
+        cluster_cols = ', '.join(dict.fromkeys(c.strip() for c in dist_cols.split(',')))
         
         # Remove DISTRIBUTE BY / SORT BY from end
-        fixed_sql = re.sub(dist_pattern, ';', fixed_sql, flags=re.IGNORECASE)
+        fixed_sql = _DIST_RE.sub(';', fixed_sql)
         
         # Add CLUSTER BY to CREATE TABLE (after CREATE TABLE tablename, before AS SELECT)
-        if 'CREATE TABLE' in fixed_sql.upper() and 'AS' in fixed_sql.upper():
+        sql_upper = fixed_sql.upper()
+        if 'CREATE TABLE' in sql_upper and 'AS' in sql_upper:
             # Insert CLUSTER BY after table name and any USING/OPTIONS clause, before AS
             # Pattern handles AS and SELECT on different lines
-            create_pattern = r'(CREATE TABLE \w+)((?:\s+USING \w+)?(?:\s+OPTIONS \([^)]+\))?)\s+(AS)(?:\s+)(SELECT)'
-            if re.search(create_pattern, fixed_sql, flags=re.IGNORECASE | re.DOTALL):
-                replacement = rf'\1\2\nCLUSTER BY ({cluster_cols})\n\3\n\4'
-                fixed_sql = re.sub(create_pattern, replacement, fixed_sql, flags=re.IGNORECASE | re.DOTALL)
+            replacement = rf'\1\2\nCLUSTER BY ({cluster_cols})\n\3\n\4'
+            fixed_sql, count = _CREATE_AS_RE.subn(replacement, fixed_sql)
+            if count:
+                sql_upper = fixed_sql.upper()
                 fixes_applied.append(f"Moved DISTRIBUTE BY to CLUSTER BY ({cluster_cols}) in table definition")
         else:
             fixes_applied.append("Removed DISTRIBUTE BY / SORT BY (Catalyst optimizer handles distribution)")
     
-    # Fix 6: Replace USING PARQUET/ORC with USING ICEBERG
-    pattern = r'USING\s+(PARQUET|ORC)'
-    if re.search(pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(pattern, 'USING ICEBERG', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Changed USING PARQUET/ORC to USING ICEBERG (managed Iceberg tables)")
-    
-    # Also handle STORED AS ORC/PARQUET
-    pattern = r'STORED\s+AS\s+(ORC|PARQUET)'
-    if re.search(pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(pattern, 'USING ICEBERG', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Changed STORED AS ORC/PARQUET to USING ICEBERG")
-    
-    # Convert TBLPROPERTIES to OPTIONS
-    pattern = r'TBLPROPERTIES\s*\(([^)]+)\)'
-    if re.search(pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(pattern, r'OPTIONS (\1)', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Changed TBLPROPERTIES to OPTIONS")
+    # Fix 6, in one scan: replace USING PARQUET/ORC and STORED AS ORC/PARQUET
+    # with USING ICEBERG, and convert TBLPROPERTIES to OPTIONS
+    if 'USING' in sql_upper or 'STORED' in sql_upper or 'TBLPROPERTIES' in sql_upper:
+        fixed_sql, notes = apply_fix_stage(fixed_sql, _FORMAT_FIXES_RE, _FORMAT_FIX_NOTES)
+        if notes:
+            sql_upper = fixed_sql.upper()
+            fixes_applied.extend(notes)
     
     # Fix 7: Remove invalid mixed aggregation/window function constructs
     # Check for MAP() containing both aggregates and window functions
-    if 'GROUP BY' in fixed_sql.upper() and 'OVER (' in fixed_sql.upper():
+    if 'GROUP BY' in sql_upper and 'OVER (' in sql_upper:
         # Pattern: MAP with window functions inside aggregation query
-        map_with_window = r"MAP\s*\([^)]*?FIRST_VALUE[^)]*?OVER[^)]+?\)[^)]*?\)"
-        if re.search(map_with_window, fixed_sql, flags=re.IGNORECASE | re.DOTALL):
+        if _MAP_WINDOW_RE.search(fixed_sql):
             # This is too complex - comment it out and add a TODO
-            fixed_sql = re.sub(
-                r'(,\s*MAP\s*\([^)]*?FIRST_VALUE.*?OVER.*?\).*?\)\s+as\s+\w+)',
+            fixed_sql = _MAP_WINDOW_COLUMN_RE.sub(
                 r'-- TODO: Fix mixed aggregate/window function\n    -- \1',
-                fixed_sql,
-                flags=re.IGNORECASE | re.DOTALL
+                fixed_sql
             )
             fixes_applied.append("Commented out invalid MAP with window functions (mixed aggregate/window not allowed)")
     
     return fixed_sql, fixes_applied
 
 
-def process_query(connection: Connection, query: str, table_name: str) -> Dict:
+def process_query(connection: Connection, query: str, table_name: str,
+                  cache: Optional[ConversionCache] = None,
+                  original_result: Optional[Dict] = None, out: TextIO = sys.stdout) -> Dict:
     """
     Process a single query: try original, convert if needed.
+    Pass original_result when the original has already been validated.
+    Progress is printed to out.
     """
-    result = {
+    result: Dict[str, Any] = {
         'table_name': table_name,
         'original_sql': query,
         'final_sql': None,
@@ -440,14 +672,15 @@ def process_query(connection: Connection, query: str, table_name: str) -> Dict:
         'conversion_notes': []
     }
     
-    print(f"  {Colors.YELLOW}Step 1: Testing original HQL...{Colors.RESET}", end=" ")
+    print(f"  {Colors.YELLOW}Step 1: Testing original HQL...{Colors.RESET}", end=" ", file=out)
     
     # Try original query first (with SET commands already removed)
-    original_result = try_original_query(connection, query, table_name)
+    if original_result is None:
+        original_result = try_original_query(connection, query, table_name)
     
     if original_result['original_works']:
         # Original works! But still check for PARQUET (should be DELTA)
-        print(f"{Colors.GREEN}✓ Works as-is!{Colors.RESET}")
+        print(f"{Colors.GREEN}✓ Works as-is!{Colors.RESET}", file=out)
         
         # Apply PARQUET→DELTA fix even on working queries
         fixed_sql, fixes_applied = apply_auto_fixes(query)
@@ -465,109 +698,146 @@ def process_query(connection: Connection, query: str, table_name: str) -> Dict:
         return result
     
     # Original failed - try auto-fixes first
-    print(f"{Colors.RED}✗ Failed{Colors.RESET}")
+    print(f"{Colors.RED}✗ Failed{Colors.RESET}", file=out)
     if original_result.get('error'):
-        print(f"  {Colors.RED}  Error: {original_result['error'][:100]}...{Colors.RESET}")
+        print(f"  {Colors.RED}  Error: {original_result['error'][:100]}...{Colors.RESET}", file=out)
     
-    print(f"  {Colors.CYAN}  Trying auto-fixes...{Colors.RESET}", end=" ")
+    print(f"  {Colors.CYAN}  Trying auto-fixes...{Colors.RESET}", end=" ", file=out)
     
     # Apply automatic fixes
     fixed_sql, fixes_applied = apply_auto_fixes(query)
     
     if fixes_applied:
-        print(f"{Colors.GREEN}✓ Applied {len(fixes_applied)} fix(es){Colors.RESET}")
+        print(f"{Colors.GREEN}✓ Applied {len(fixes_applied)} fix(es){Colors.RESET}", file=out)
         
         # Test the fixed SQL
         fixed_result = try_original_query(connection, fixed_sql, table_name)
         
         if fixed_result['original_works']:
-            print(f"  {Colors.GREEN}  Validation passed!{Colors.RESET}")
+            print(f"  {Colors.GREEN}  Validation passed!{Colors.RESET}", file=out)
             result['final_sql'] = fixed_sql
             result['status'] = 'auto_fixed'
             for fix in fixes_applied:
                 result['conversion_notes'].append(f"Auto-fix: {fix}")
             return result
         else:
-            print(f"  {Colors.YELLOW}  Still has issues, trying AI conversion...{Colors.RESET}")
+            print(f"  {Colors.YELLOW}  Still has issues, trying AI conversion...{Colors.RESET}", file=out)
             # Fall through to AI conversion
     else:
-        print(f"{Colors.YELLOW}No auto-fixes available{Colors.RESET}")
+        print(f"{Colors.YELLOW}No auto-fixes available{Colors.RESET}", file=out)
         # Fall through to AI conversion
     
     # Try AI conversion
-    print(f"  {Colors.YELLOW}Step 2: Converting with AI_QUERY...{Colors.RESET}", end=" ")
+    print(f"  {Colors.YELLOW}Step 2: Converting with AI_QUERY...{Colors.RESET}", end=" ", file=out)
     
-    conversion_result = convert_with_ai(connection, query, table_name, original_result['error'])
+    conversion_result = convert_with_ai(connection, query, table_name, original_result['error'], cache)
     
     if conversion_result['conversion_error']:
-        print(f"{Colors.RED}✗ Conversion failed{Colors.RESET}")
+        print(f"{Colors.RED}✗ Conversion failed{Colors.RESET}", file=out)
         result['status'] = 'failed'
         result['conversion_notes'].append(f"AI conversion failed: {conversion_result['conversion_error']}")
         return result
     
-    print(f"{Colors.GREEN}✓ Converted{Colors.RESET}")
+    if conversion_result['from_cache']:
+        print(f"{Colors.GREEN}✓ Loaded from cache{Colors.RESET}", file=out)
+    else:
+        print(f"{Colors.GREEN}✓ Converted{Colors.RESET}", file=out)
     
     # Validate converted SQL
-    print(f"  {Colors.YELLOW}Step 3: Validating converted SQL...{Colors.RESET}", end=" ")
+    print(f"  {Colors.YELLOW}Step 3: Validating converted SQL...{Colors.RESET}", end=" ", file=out)
     
     if conversion_result['validation_works']:
-        print(f"{Colors.GREEN}✓ Valid!{Colors.RESET}")
+        print(f"{Colors.GREEN}✓ Valid!{Colors.RESET}", file=out)
         result['final_sql'] = conversion_result['converted_sql']
         result['status'] = 'ai_converted'
         result['conversion_notes'].append("Original failed - successfully converted with AI_QUERY")
     else:
-        print(f"{Colors.RED}✗ Validation failed{Colors.RESET}")
+        print(f"{Colors.RED}✗ Validation failed{Colors.RESET}", file=out)
         result['status'] = 'failed'
         result['conversion_notes'].append(f"Conversion validation failed: {conversion_result['validation_error']}")
     
     return result
 
 
-def process_hql_file(connection: Connection, file_path: Path, output_dir: Path) -> List[Dict]:
+# Output files are written through a large buffer, so the many small writes
+# reach the OS in a few big chunks
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def format_final_block(result: Dict, file_name: str) -> str:
+    """Format one processed statement for the *_final.sql output file."""
+    notes = ''.join(f"-- Note: {note}\n" for note in result['conversion_notes'])
+    return (f"-- Table: {result['table_name']}\n"
+            f"-- Original file: {file_name}\n"
+            f"-- Status: {result['status'].upper().replace('_', ' ')}\n"
+            f"{notes}\n"
+            f"{result['final_sql']}\n\n"
+            f"{'-' * 80}\n")
+
+
+def process_hql_file(connection: Connection, file_path: Path, output_dir: Path,
+                     cache: Optional[ConversionCache] = None,
+                     known_results: Optional[StatementResults] = None,
+                     out: TextIO = sys.stdout) -> List[Dict]:
     """
     Process a single HQL file: try original, convert what's needed.
+    Statements found in known_results are not processed again.
+    Progress is printed to out.
     """
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}Processing: {file_path.name}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}", file=out)
+    print(f"{Colors.CYAN}{Colors.BOLD}Processing: {file_path.name}{Colors.RESET}", file=out)
+    print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}\n", file=out)
     
-    with open(file_path, 'r') as f:
-        hql_content = f.read()
+    # Decode explicitly rather than with the locale's default encoding
+    hql_content = file_path.read_text(encoding='utf-8')
     
     statements = extract_statements(hql_content)
     results = []
     output_statements = []
     
-    for i, stmt_info in enumerate(statements, 1):
+    # Statements already processed (here or in another file) are reused
+    known = [known_results.get(stmt_info['sql']) if known_results else None
+             for stmt_info in statements]
+    
+    # Validate every other original statement up front, pipelining the EXPLAINs
+    original_results = iter(try_original_queries(
+        connection, [stmt_info for stmt_info, result in zip(statements, known) if result is None]))
+    
+    for i, (stmt_info, result) in enumerate(zip(statements, known), 1):
         table_name = stmt_info['table_name']
         query = stmt_info['sql']
         
-        print(f"{Colors.YELLOW}{Colors.BOLD}[{i}/{len(statements)}] Processing: {table_name}{Colors.RESET}")
-        result = process_query(connection, query, table_name)
+        print(f"{Colors.YELLOW}{Colors.BOLD}[{i}/{len(statements)}] Processing: {table_name}{Colors.RESET}", file=out)
+        if result is None:
+            original_result = next(original_results)
+            # A statement repeated within this file is known by now
+            result = known_results.get(query) if known_results else None
+        if result is not None:
+            print(f"  {Colors.GREEN}✓ Reused result of an identical statement{Colors.RESET}", file=out)
+            result['table_name'] = table_name
+        else:
+            result = process_query(connection, query, table_name, cache, original_result, out)
+            if known_results:
+                known_results.put(query, result)
         result['file'] = file_path.stem
         results.append(result)
         
         # Add to output
         if result['final_sql']:
-            output_statements.append(f"-- Table: {table_name}")
-            output_statements.append(f"-- Original file: {file_path.name}")
-            output_statements.append(f"-- Status: {result['status'].upper().replace('_', ' ')}")
-            for note in result['conversion_notes']:
-                output_statements.append(f"-- Note: {note}")
-            output_statements.append("")
-            output_statements.append(result['final_sql'])
-            output_statements.append("")
-            output_statements.append("-" * 80)
-            output_statements.append("")
+            output_statements.append(format_final_block(result, file_path.name))
         
-        print()
+        print(file=out)
     
     # Save to file
     if output_statements:
         output_file = output_dir / f"{file_path.stem}_final.sql"
-        with open(output_file, 'w') as f:
-            f.write('\n'.join(output_statements))
-        print(f"{Colors.GREEN}✓ Saved final SQL to: {output_file.name}{Colors.RESET}")
+        with open(output_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            # Stream the newline-separated blocks instead of joining them first
+            f.write(output_statements[0])
+            for block in output_statements[1:]:
+                f.write('\n')
+                f.write(block)
+        print(f"{Colors.GREEN}✓ Saved final SQL to: {output_file.name}{Colors.RESET}", file=out)
     
     return results
 
@@ -605,7 +875,7 @@ def print_summary(all_results: List[Dict]):
 
 def save_detailed_results(all_results: List[Dict], output_file: Path):
     """Save detailed processing results to a file."""
-    with open(output_file, 'w') as f:
+    with open(output_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
         f.write("=" * 80 + "\n")
         f.write("Smart HQL to Spark SQL Conversion Results\n")
         f.write("Strategy: Test original first, AI-convert only what fails\n")
@@ -634,6 +904,8 @@ def main():
     # Configuration
     DATABRICKS_PROFILE = os.getenv('DATABRICKS_PROFILE', 'fe')
     WAREHOUSE_ID = os.getenv('DATABRICKS_WAREHOUSE_ID')
+    # HQL files processed concurrently, each on its own connection
+    FILE_WORKERS = int(os.getenv('HQL_FILE_WORKERS', '4'))
     
     # Get script directory and set up paths
     script_dir = Path(__file__).parent.parent
@@ -684,11 +956,14 @@ def main():
             print(f"{Colors.YELLOW}No WAREHOUSE_ID set. Attempting default connection...{Colors.RESET}")
             http_path = '/sql/1.0/warehouses/default'
         
-        connection = sql.connect(
-            server_hostname=server_hostname,
-            http_path=http_path,
-            access_token=token
-        )
+        def connect() -> Connection:
+            return sql.connect(
+                server_hostname=server_hostname,
+                http_path=http_path,
+                access_token=token
+            )
+        
+        connection = connect()
         print(f"{Colors.GREEN}✓ Connected successfully{Colors.RESET}")
         
     except Exception as e:
@@ -697,16 +972,35 @@ def main():
         print(f"{Colors.YELLOW}Update WAREHOUSE_ID in the script with your warehouse ID.{Colors.RESET}")
         return
     
-    # Process all HQL files
+    # Reuse AI conversions from previous runs and from repeated statements
+    cache = ConversionCache(output_dir / 'ai_conversion_cache.db')
+    # Process statements repeated across files only once
+    known_results = StatementResults()
+    
+    connections = ThreadConnections(connect, connection)
+    print_lock = threading.Lock()
+    
+    def process_buffered(hql_file: Path) -> List[Dict]:
+        # Print each file's progress as one block so concurrent files don't interleave
+        out = io.StringIO()
+        try:
+            return process_hql_file(connections.get(), hql_file, output_dir, cache, known_results, out)
+        finally:
+            with print_lock:
+                print(out.getvalue(), end='')
+    
+    # Process HQL files concurrently; the warehouse calls are network-bound
     all_results = []
     try:
-        for hql_file in hql_files:
-            file_results = process_hql_file(connection, hql_file, output_dir)
-            all_results.extend(file_results)
+        with ThreadPoolExecutor(max_workers=max(1, min(len(hql_files), FILE_WORKERS))) as executor:
+            # map() preserves file order, keeping the summary stable between runs
+            for file_results in executor.map(process_buffered, hql_files):
+                all_results.extend(file_results)
     finally:
-        if connection:
-            connection.close()
-            print(f"\n{Colors.YELLOW}Connection closed{Colors.RESET}")
+        cache.close()
+        connections.close()
+        connection.close()
+        print(f"\n{Colors.YELLOW}Connection closed{Colors.RESET}")
     
     # Print summary
     print_summary(all_results)
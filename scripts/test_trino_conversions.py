@@ -1,13 +1,46 @@
 #!/usr/bin/env python3
 """
 Quick test: Execute converted Trino SQL in Databricks to verify they work.
+Run with --mode explain to only EXPLAIN each query instead of executing it.
 """
 
+import io
 import os
-import configparser
+import argparse
+import re
+import sys
+import json
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Tuple
+from typing import Deque, Dict, Iterable, List, Optional, TextIO, Tuple
 from databricks import sql
+from databricks.sql.client import Connection, Cursor
+from _common import ThreadConnections, read_databricks_config, submit_query
+
+try:
+    import pyarrow  # Arrow results: rows are counted without building Python tuples
+except ImportError:
+    pyarrow = None
+
+# Whole comment lines, separator lines (-----) included, with their newline
+_COMMENT_LINE_RE = re.compile(r'^[ \t]*--[^\n]*(?:\n|\Z)', re.MULTILINE)
+
+# The separator line the converter writes after each statement's block
+_SEPARATOR_LINE_RE = re.compile(r'^-{80}[ \t]*$', re.MULTILINE)
+
+# Result rows fetched per round trip when counting a query's rows
+FETCH_BATCH_ROWS = 10_000
+
+# Quoted literals and identifiers, comments, and the ; between statements
+_STATEMENT_TOKEN_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|--[^\n]*|/\*.*?\*/|;",
+                                 re.DOTALL)
+
+# A query that can be nested in a subquery starts with SELECT or WITH
+_NESTABLE_RE = re.compile(r'(?:SELECT|WITH)\b', re.IGNORECASE)
 
 # ANSI color codes
 class Colors:
@@ -21,44 +54,382 @@ class Colors:
     BOLD = '\033[1m'
 
 
-def read_databricks_config(profile: str = 'DEFAULT') -> Tuple[str, str]:
-    """Read Databricks configuration from .databrickscfg file."""
-    config_path = Path.home() / '.databrickscfg'
-    config = configparser.ConfigParser()
-    config.read(config_path)
+class ThreadCursors:
+    """
+    Hands each worker thread its own cursor, on the thread's connection from
+    connections (see _common.ThreadConnections). Close the cursors with
+    close(); the connections are closed with connections.
+    """
+    
+    def __init__(self, connections: ThreadConnections):
+        self._connections = connections
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cursors: List[Cursor] = []
+    
+    def get(self) -> Cursor:
+        """Return the calling thread's cursor, opening it on first use."""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._connections.get().cursor()
+            with self._lock:
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        return cursor
+    
+    def close(self):
+        """Close every cursor handed out."""
+        with self._lock:
+            for cursor in self._cursors:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            self._cursors.clear()
+
+
+class PassedQueryCache:
+    """
+    Queries that passed in earlier runs, kept in a JSON file so unchanged
+    files are not tested again. Entries are keyed by a BLAKE2b hash of the
+    warehouse, schema and query, so editing a file's SQL (or testing against
+    another warehouse or schema) tests it again. Call save() to write it back.
+    """
+    
+    def __init__(self, path: Path, warehouse_id: str, schema: str):
+        self._path = path
+        self._scope = f"{warehouse_id}\n{schema}\n"
+        try:
+            self._passed = set(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            self._passed = set()
+    
+    def key(self, query: str) -> str:
+        """Cache key for a query under this warehouse and schema."""
+        return hashlib.blake2b((self._scope + query).encode('utf-8'), digest_size=16).hexdigest()
+    
+    def passed(self, query: str) -> bool:
+        """Whether the query passed in an earlier run."""
+        return self.key(query) in self._passed
+    
+    def add(self, query: str):
+        """Record a query that passed."""
+        self._passed.add(self.key(query))
     
-    host = config[profile]['host'].strip()
-    token = config[profile]['token'].strip()
+    def save(self):
+        """Write the cache file."""
+        self._path.write_text(json.dumps(sorted(self._passed)), encoding='utf-8')
+
+
+def split_statements(query: str) -> List[str]:
+    """
+    Split SQL into its statements on the semicolons outside quoted literals,
+    identifiers and comments. Comments are dropped, so no statement ends
+    inside a -- comment.
+    """
+    statements = []
+    parts = []
+    position = 0
+    for match in _STATEMENT_TOKEN_RE.finditer(query):
+        token = match.group()
+        if token == ';' or token.startswith(('--', '/*')):
+            parts.append(query[position:match.start()])
+            position = match.end()
+            if token == ';':
+                statements.append(''.join(parts).strip())
+                parts = []
+            else:
+                parts.append(' ')
+    parts.append(query[position:])
+    statements.append(''.join(parts).strip())
+    return [statement for statement in statements if statement]
+
+
+def query_statements(query: str) -> List[str]:
+    """
+    The statements a file's query runs: the query itself unless it holds
+    several ;-separated statements (the connector only runs the first
+    statement of a multi-statement string).
+    """
+    if ';' not in query.rstrip(';').strip():
+        return [query]
+    statements = split_statements(query)
+    return statements if len(statements) > 1 else [query]
+
+
+def submit_file_query(cursor: Cursor, query: str) -> Optional[Exception]:
+    """
+    Start a file's query (the first of its statements, see query_statements)
+    with submit_query. Returns the submission error, if any.
+    """
+    return submit_query(cursor, query_statements(query)[0])
+
+
+def fetch_row_count(cursor: Cursor) -> int:
+    """
+    Count a finished query's rows, FETCH_BATCH_ROWS at a time so memory stays
+    bounded however large the result is (as Arrow tables when pyarrow is installed).
+    """
+    if not cursor.description:
+        # DDL and other statements without a result set: nothing to fetch
+        return 0
     
-    return host, token
+    row_count = 0
+    while True:
+        if pyarrow is not None:
+            batch_rows = cursor.fetchmany_arrow(FETCH_BATCH_ROWS).num_rows
+        else:
+            batch_rows = len(cursor.fetchmany(FETCH_BATCH_ROWS))
+        if batch_rows == 0:
+            return row_count
+        row_count += batch_rows
 
 
-def test_query(cursor, query: str, query_name: str) -> bool:
-    """Test a single query by executing it."""
+def await_query(cursor: Cursor, query_name: str, query: str, error: Optional[Exception] = None,
+                out: Optional[TextIO] = None) -> bool:
+    """
+    Wait for a query started with submit_file_query (failed to submit with error,
+    if given), run the rest of its statements in order, and report whether
+    they all ran. The row count is the last statement's. Progress is printed
+    to out.
+    """
     try:
-        print(f"  {Colors.YELLOW}Testing: {query_name}...{Colors.RESET}", end=" ")
-        cursor.execute(query)
-        result = cursor.fetchall()
-        print(f"{Colors.GREEN}✓ Success ({len(result)} rows){Colors.RESET}")
+        print(f"  {Colors.YELLOW}Testing: {query_name}...{Colors.RESET}", end=" ", file=out)
+        if error is not None:
+            raise error
+        if hasattr(cursor, 'execute_async'):
+            cursor.get_async_execution_result()
+        for statement in query_statements(query)[1:]:
+            cursor.execute(statement)
+        row_count = fetch_row_count(cursor)
+        print(f"{Colors.GREEN}✓ Success ({row_count} rows){Colors.RESET}", file=out)
         return True
     except Exception as e:
-        print(f"{Colors.RED}✗ Failed{Colors.RESET}")
-        print(f"    {Colors.RED}Error: {str(e)[:150]}{Colors.RESET}")
+        print(f"{Colors.RED}✗ Failed{Colors.RESET}", file=out)
+        print(f"    {Colors.RED}Error: {str(e)[:150]}{Colors.RESET}", file=out)
         return False
 
 
+def extract_query(content: str) -> str:
+    """
+    Extract the SQL of a converted file (skip comment and separator lines).
+    The converter writes each statement in its own block without a trailing
+    semicolon, so the statements of a file with several blocks are joined
+    with ; for query_statements to split them again.
+    """
+    blocks = [sql for sql in (_COMMENT_LINE_RE.sub('', block).strip()
+                              for block in _SEPARATOR_LINE_RE.split(content)) if sql]
+    if len(blocks) <= 1:
+        return blocks[0] if blocks else ''
+    return '\n\n'.join(f"{sql.rstrip(';').rstrip()};" for sql in blocks)
+
+
+def read_query(sql_file: Path, explain: bool = False) -> str:
+    """Read the SQL of one converted file; with explain, an EXPLAIN of it."""
+    # Decode explicitly rather than with the locale's default encoding
+    query = extract_query(sql_file.read_text(encoding='utf-8'))
+    if not explain or not query:
+        return query
+    statements = query_statements(query)
+    if len(statements) == 1:
+        return f"EXPLAIN {query}"
+    return '\n'.join(f"EXPLAIN {statement};" for statement in statements)
+
+
+def report_known(query_name: str, row_count: Optional[int], out: Optional[TextIO] = None) -> bool:
+    """
+    Report a query that already ran in a batch (see count_rows_batched), or
+    with no row_count, one that passed in an earlier run (see PassedQueryCache).
+    """
+    print(f"  {Colors.YELLOW}Testing: {query_name}...{Colors.RESET}", end=" ", file=out)
+    if row_count is None:
+        print(f"{Colors.GREEN}✓ Unchanged, passed in an earlier run{Colors.RESET}", file=out)
+    else:
+        print(f"{Colors.GREEN}✓ Success ({row_count} rows){Colors.RESET}", file=out)
+    return True
+
+
+def is_nestable(query: str) -> bool:
+    """Whether a query is a single SELECT (or WITH ... SELECT) that can be nested in a subquery."""
+    body = query.rstrip(';').strip()
+    return bool(_NESTABLE_RE.match(body)) and ';' not in body
+
+
+def count_batch_rows(cursor: Cursor, batch: List[Tuple[Path, str]]) -> Dict[Path, int]:
+    """
+    Run single-SELECT queries as one UNION ALL of their row counts, a single
+    round trip. Returns each file's row count, or nothing if the batch failed.
+    """
+    # The query goes on its own lines so a trailing -- comment can't swallow the )
+    batch_query = "\nUNION ALL\n".join(
+        f"SELECT {i} AS query_index, (SELECT COUNT(*) FROM (\n{query.rstrip(';').strip()}\n)) AS row_count"
+        for i, (_, query) in enumerate(batch)
+    )
+    try:
+        cursor.execute(batch_query)
+        rows = cursor.fetchall()
+    except Exception:
+        return {}
+    return {batch[i][0]: row_count for i, row_count in rows}
+
+
+def count_rows_batched(connection: Connection, files: Iterable[Tuple[Path, str]], batch_size: int,
+                       passed_cache: Optional[PassedQueryCache] = None) -> Tuple[List[Tuple[Path, str]], Dict[Path, Optional[int]]]:
+    """
+    Run the files' single-SELECT queries batch_size at a time (see
+    count_batch_rows). Files are taken as they are read, so each batch is sent
+    as soon as it fills while later files are still being read. Queries that
+    passed in an earlier run (per passed_cache) are not run at all.
+    Returns the files as read and the known results: row counts of the files
+    whose batch ran, None for those that passed before. A batch that fails
+    (any one query in it) is left to be tested one query at a time, which
+    pinpoints the failing query.
+    """
+    read_files: List[Tuple[Path, str]] = []
+    row_counts: Dict[Path, Optional[int]] = {}
+    batch: List[Tuple[Path, str]] = []
+    
+    with connection.cursor() as cursor:
+        for sql_file, query in files:
+            read_files.append((sql_file, query))
+            if query and passed_cache and passed_cache.passed(query):
+                row_counts[sql_file] = None
+                continue
+            if batch_size < 2 or not query or not is_nestable(query):
+                continue
+            batch.append((sql_file, query))
+            if len(batch) == batch_size:
+                row_counts.update(count_batch_rows(cursor, batch))
+                batch = []
+        if len(batch) > 1:
+            row_counts.update(count_batch_rows(cursor, batch))
+    
+    return read_files, row_counts
+
+
+def test_sql_file(cursor: Optional[Cursor], sql_file: Path, query: str,
+                  known: Dict[Path, Optional[int]], out: Optional[TextIO] = None) -> Optional[bool]:
+    """
+    Test the SQL of one converted file, unless its result is already known
+    (see count_rows_batched; no cursor is needed then). Returns whether it
+    ran, or None if the file holds no SQL.
+    """
+    print(f"\n{Colors.CYAN}{Colors.BOLD}Testing: {sql_file.name}{Colors.RESET}", file=out)
+    if not query:
+        return None
+    if sql_file in known:
+        return report_known(sql_file.stem, known[sql_file], out)
+    return await_query(cursor, sql_file.stem, query, submit_file_query(cursor, query), out)
+
+
+def report_aborted(max_failures: int):
+    """Report a run stopped once more than max_failures files failed."""
+    print(f"\n{Colors.RED}{Colors.BOLD}✗ aborted: failure budget exceeded "
+          f"(more than {max_failures} failed){Colors.RESET}")
+
+
+def test_sql_files_pipelined(connection: Connection, files: List[Tuple[Path, str]],
+                             known: Dict[Path, Optional[int]], max_in_flight: int,
+                             max_failures: int = 0) -> List[Optional[bool]]:
+    """
+    Test converted files on one connection, each query on its own cursor.
+    Up to max_in_flight queries are started with execute_async before the
+    oldest is awaited, so their round trips overlap; results are reported in
+    file order, each file's report written to stdout in one piece. Files whose
+    result is already known (see count_rows_batched) are only reported.
+    Once more than max_failures files fail (0: no limit), the queries still
+    in flight are cancelled and the rest are not started.
+    Returns, per file tested, whether it ran (None if it holds no SQL).
+    """
+    results: List[Optional[bool]] = []
+    pending: Deque[Tuple[Path, str, Optional[Cursor], Optional[Exception]]] = deque()
+    
+    def finish_oldest():
+        sql_file, query, cursor, error = pending.popleft()
+        out = io.StringIO()
+        print(f"\n{Colors.CYAN}{Colors.BOLD}Testing: {sql_file.name}{Colors.RESET}", file=out)
+        if sql_file in known:
+            results.append(report_known(sql_file.stem, known[sql_file], out))
+        elif cursor is None:
+            results.append(None)
+        else:
+            try:
+                results.append(await_query(cursor, sql_file.stem, query, error, out))
+            finally:
+                cursor.close()
+        sys.stdout.write(out.getvalue())
+    
+    def over_budget() -> bool:
+        return 0 < max_failures < results.count(False)
+    
+    for sql_file, query in files:
+        cursor = connection.cursor() if query and sql_file not in known else None
+        error = submit_file_query(cursor, query) if cursor else None
+        pending.append((sql_file, query, cursor, error))
+        if len(pending) >= max(1, max_in_flight):
+            finish_oldest()
+            if over_budget():
+                break
+    while pending and not over_budget():
+        finish_oldest()
+    
+    if pending:
+        # Over budget: stop paying for queries whose results won't be used
+        for _, _, cursor, _ in pending:
+            if cursor is not None:
+                try:
+                    cursor.cancel()
+                finally:
+                    cursor.close()
+        report_aborted(max_failures)
+    
+    return results
+
+
+def scan_converted_files(converted_dir: Path) -> List[os.DirEntry]:
+    """
+    List the converted SQL files (*_databricks.sql) in a directory with one
+    scandir pass; the entries keep their stat results for sorting.
+    """
+    try:
+        with os.scandir(converted_dir) as entries:
+            return [entry for entry in entries
+                    if entry.name.endswith('_databricks.sql') and not entry.name.startswith('.')
+                    and entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
 def main():
     """Main execution."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=('execute', 'explain'), default='execute',
+                        help='execute each query, or only EXPLAIN it: a cheap check that '
+                             'it parses and its names resolve, without running it')
+    args = parser.parse_args()
+    
     DATABRICKS_PROFILE = os.getenv('DATABRICKS_PROFILE', 'fe')
     WAREHOUSE_ID = os.getenv('DATABRICKS_WAREHOUSE_ID')
     SCHEMA = 'hql_test'
+    # Queries in flight at once: started asynchronously on one connection, or
+    # on worker threads with their own connections for connectors without execute_async
+    MAX_CONCURRENCY = int(os.getenv('DATABRICKS_MAX_CONCURRENCY', '8'))
+    # Single-SELECT queries run this many to a round trip (1 disables batching)
+    BATCH_SIZE = int(os.getenv('TRINO_TEST_BATCH_SIZE', '20'))
+    # Skip files whose SQL passed in an earlier run; TRINO_TEST_CACHE=0 tests everything
+    USE_CACHE = os.getenv('TRINO_TEST_CACHE', '1') == '1'
+    # Stop once more than this many files fail, e.g. in CI (0: test every file)
+    MAX_FAILURES = int(os.getenv('TRINO_TEST_MAX_FAILURES', '0'))
     
     # Get paths
     script_dir = Path(__file__).parent.parent
     converted_dir = script_dir / 'databricks_from_trino'
     
-    # Find converted SQL files
-    sql_files = sorted(converted_dir.glob('*_databricks.sql'))
+    # Find converted SQL files, largest first: with queries running
+    # concurrently, starting the (likely) slowest early shortens the whole run
+    sql_files = [Path(entry.path) for entry in sorted(
+        scan_converted_files(converted_dir),
+        key=lambda entry: (-entry.stat().st_size, entry.name))]
     
     if not sql_files:
         print(f"{Colors.RED}No converted SQL files found in {converted_dir}{Colors.RESET}")
@@ -82,55 +453,84 @@ def main():
         return
     
     # Connect
-    connection = None
+    connection = connections = cursors = None
     try:
         print(f"{Colors.YELLOW}Connecting to Databricks SQL...{Colors.RESET}")
-        server_hostname = host.replace('https://', '')
+        # Derived once; every connection opened below reuses them
+        server_hostname = host.removeprefix('https://')
         http_path = f'/sql/1.0/warehouses/{WAREHOUSE_ID}'
         
-        connection = sql.connect(
-            server_hostname=server_hostname,
-            http_path=http_path,
-            access_token=token
-        )
+        def connect() -> Connection:
+            # Each connection pays one TLS handshake and session open and stays
+            # open for the whole run. USE SCHEMA is session state, so it is set
+            # once per connection.
+            # The user agent tags the test's queries in the warehouse's query
+            # history; transient failures are retried after 0.1s, not 1s
+            connection = sql.connect(
+                server_hostname=server_hostname,
+                http_path=http_path,
+                access_token=token,
+                user_agent_entry='hiveql-converter-trino-test',
+                _retry_delay_min=0.1
+            )
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'USE SCHEMA {SCHEMA}')
+            except Exception:
+                connection.close()
+                raise
+            return connection
+        
+        # Opened once and reused by every file (and, pipelined, every cursor)
+        connection = connect()
+        connections = ThreadConnections(connect, connection)
+        cursors = ThreadCursors(connections)
         print(f"{Colors.GREEN}✓ Connected successfully{Colors.RESET}")
+        print(f"{Colors.CYAN}Using schema: {SCHEMA}{Colors.RESET}")
+        print(f"{Colors.CYAN}Mode: {args.mode}{Colors.RESET}\n")
         
-        cursor = connection.cursor()
-        cursor.execute(f'USE SCHEMA {SCHEMA}')
-        print(f"{Colors.CYAN}Using schema: {SCHEMA}{Colors.RESET}\n")
+        passed_cache = None
+        if USE_CACHE:
+            passed_cache = PassedQueryCache(converted_dir / '.test_cache.json', WAREHOUSE_ID, SCHEMA)
         
-        # Test each file
-        passed = 0
-        failed = 0
+        # Files are read on background threads while the batches run. EXPLAINs
+        # are never batched (they can't be nested), and are cached apart from
+        # executions since their text differs.
+        read = partial(read_query, explain=args.mode == 'explain')
+        with ThreadPoolExecutor(max_workers=max(1, min(len(sql_files), MAX_CONCURRENCY))) as readers:
+            files, known = count_rows_batched(
+                connection, zip(sql_files, readers.map(read, sql_files)), BATCH_SIZE, passed_cache)
         
-        for sql_file in sql_files:
-            print(f"\n{Colors.CYAN}{Colors.BOLD}Testing: {sql_file.name}{Colors.RESET}")
-            
-            with open(sql_file, 'r') as f:
-                content = f.read()
-            
-            # Extract the actual SQL (skip comments and separator lines)
-            lines = content.split('\n')
-            sql_lines = []
-            in_sql = False
+        # Test the other files concurrently; the queries are bound by warehouse round trips
+        if hasattr(Cursor, 'execute_async'):
+            file_results = test_sql_files_pipelined(connection, files, known, MAX_CONCURRENCY, MAX_FAILURES)
+        else:
+            def test_buffered(sql_file: Path, query: str) -> Tuple[Optional[bool], str]:
+                # Workers buffer their file's report; only the main thread writes to stdout
+                out = io.StringIO()
+                cursor = cursors.get() if query and sql_file not in known else None
+                return test_sql_file(cursor, sql_file, query, known, out), out.getvalue()
             
-            for line in lines:
-                if line.startswith('--') or line.startswith('-----'):
-                    continue
-                if line.strip():
-                    in_sql = True
-                if in_sql:
-                    sql_lines.append(line)
-            
-            query = '\n'.join(sql_lines).strip()
-            
-            if query:
-                if test_query(cursor, query, sql_file.stem):
-                    passed += 1
-                else:
-                    failed += 1
+            file_results = []
+            with ThreadPoolExecutor(max_workers=max(1, min(len(sql_files), MAX_CONCURRENCY))) as executor:
+                # map() preserves file order, keeping the report stable between runs
+                for ok, report in executor.map(test_buffered, *zip(*files)):
+                    sys.stdout.write(report)
+                    file_results.append(ok)
+                    if 0 < MAX_FAILURES < file_results.count(False):
+                        # Files not yet started are dropped; running ones finish
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        report_aborted(MAX_FAILURES)
+                        break
+        
+        passed = file_results.count(True)
+        failed = file_results.count(False)
         
-        cursor.close()
+        if passed_cache:
+            for (_, query), ok in zip(files, file_results):
+                if ok:
+                    passed_cache.add(query)
+            passed_cache.save()
         
         # Summary
         print(f"\n{Colors.MAGENTA}{Colors.BOLD}{'='*80}{Colors.RESET}")
@@ -148,6 +548,10 @@ def main():
     except Exception as e:
         print(f"{Colors.RED}✗ Error: {e}{Colors.RESET}")
     finally:
+        if cursors:
+            cursors.close()
+        if connections:
+            connections.close()
         if connection:
             connection.close()
 
@@ -24,11 +24,20 @@ AI Model: databricks-claude-sonnet-4-5 (Claude Sonnet 4.5)
 
 import os
 import re
-import configparser
+import json
+import hashlib
+from collections import Counter
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from databricks import sql
 from databricks.sql.client import Connection
+from _common import collect_query, read_databricks_config, submit_query
+
+try:
+    import re2  # google-re2: linear-time matching, no backtracking
+except ImportError:
+    re2 = None
 
 # ANSI color codes
 class Colors:
@@ -42,64 +51,171 @@ class Colors:
     BOLD = '\033[1m'
 
 
-def read_databricks_config(profile: str = 'DEFAULT') -> Tuple[str, str]:
-    """Read Databricks configuration from .databrickscfg file."""
-    config_path = Path.home() / '.databrickscfg'
+def compile_linear(pattern: str):
+    """
+    Compile a pattern with RE2 when google-re2 is installed, so matching time
+    is linear in the input however the pattern could backtrack; otherwise
+    with re, ASCII-only like RE2's \\w, \\b and \\s. Flags must be given
+    inline, e.g. (?i).
+    """
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except Exception:
+            pass  # Syntax RE2 doesn't support
+    return re.compile(pattern, re.ASCII)
+
+
+# apply_trino_to_databricks_fixes patterns: every fix is one alternative of a
+# single pattern, so the SQL is scanned once. Each alternative is a named
+# group and maps to the note recorded when it fires (in report order).
+# Function arguments may hold calls or parenthesized expressions up to two
+# levels deep, e.g. CAST(coalesce(a, b) AS JSON); deeper ones are left to
+# AI_QUERY. The argument patterns can backtrack heavily on long statements
+# with unclosed calls, so these use RE2 when available.
+# SQL keywords and identifiers are ASCII, so the SQL patterns below are
+# compiled with re.ASCII: case-insensitive matching, \w, \b and \s skip the
+# Unicode tables.
+#
+# Kept as-is, since Spark supports them too: date_trunc('unit', date) and
+# element_at().
+# date_add('unit', n, date): date_add(date, n) for days, add_months(date, n)
+# for months and years.
+# date_diff('day', start, end) → datediff(end, start)
+# FROM t CROSS JOIN UNNEST(t.arr) AS u(elem) → FROM t LATERAL VIEW explode(t.arr) u AS elem
+_TRINO_FIX_NOTES = {
+    'varchar': "Converted VARCHAR to STRING",
+    'varbinary': "Converted VARBINARY to BINARY",
+    'cardinality': "Converted cardinality() to size()",
+    'json_extract_scalar': "Converted json_extract_scalar() to get_json_object()",
+    'array_agg_distinct': "Converted array_agg(DISTINCT) to collect_set()",
+    'array_agg': "Converted array_agg() to collect_list()",
+    'approx_percentile': "Converted approx_percentile() to percentile_approx()",
+    'arbitrary': "Converted arbitrary() to first()",
+    'date_add_day': "Converted date_add('day', n, date) to date_add(date, n)",
+    'date_add_month': "Converted date_add('month', n, date) to add_months(date, n)",
+    'date_add_year': "Converted date_add('year', n, date) to add_months(date, n*12)",
+    'date_diff': "Converted date_diff('day', start, end) to datediff(end, start)",
+    'unnest': "Converted CROSS JOIN UNNEST() to LATERAL VIEW explode()",
+    'row': "Converted ROW() to STRUCT()",
+    'json_cast': "Converted CAST(x AS JSON) to to_json(x)",
+    'interval': "Converted INTERVAL 'n' UNIT to INTERVAL n UNIT",
+    'json_extract_cast': "TODO: Review json_extract() with CAST - may need from_json() with schema",
+    'with_format': "Converted WITH (format = '{}') to USING ICEBERG",
+}
+# Fixes that replace the whole match with fixed text
+_TRINO_TOKEN_FIXES = {
+    'varchar': 'STRING',
+    'varbinary': 'BINARY',
+    'cardinality': 'size(',
+    'json_extract_scalar': 'get_json_object(',
+    'array_agg_distinct': 'collect_set(',
+    'array_agg': 'collect_list(',
+    'approx_percentile': 'percentile_approx(',
+    'arbitrary': 'first(',
+    'row': 'STRUCT(',
+    'with_format': 'USING ICEBERG',
+}
+# One function argument, with balanced parentheses inside; _ARG_NO_COMMA is
+# one argument of several
+_NESTED_PARENS = r'\((?:[^()]|\([^()]*\))*\)'
+_ARG = rf'(?:[^()]|{_NESTED_PARENS})+'
+_ARG_NO_COMMA = rf'(?:[^(),]|{_NESTED_PARENS})+'
+_TRINO_FIXES_RE = compile_linear('(?i)' + '|'.join([
+    r'(?P<varchar>\bVARCHAR(?:\(\d+\))?\b)',
+    r'(?P<varbinary>\bVARBINARY\b)',
+    r'(?P<cardinality>\bcardinality\s*\()',
+    r'(?P<json_extract_scalar>\bjson_extract_scalar\s*\()',
+    r'(?P<array_agg_distinct>\barray_agg\s*\(\s*DISTINCT\s+)',
+    r'(?P<array_agg>\barray_agg\s*\()',
+    r'(?P<approx_percentile>\bapprox_percentile\s*\()',
+    r'(?P<arbitrary>\barbitrary\s*\()',
+    rf"(?P<date_add>date_add\s*\(\s*'(?P<add_unit>day|month|year)'\s*,\s*(?P<add_n>-?\d+)\s*,\s*(?P<add_date>{_ARG})\))",
+    rf"(?P<date_diff>date_diff\s*\(\s*'day'\s*,\s*(?P<diff_start>{_ARG_NO_COMMA}),\s*(?P<diff_end>{_ARG})\))",
+    rf'(?P<unnest>CROSS\s+JOIN\s+UNNEST\s*\(\s*(?P<unnest_array>{_ARG})\s*\)\s+(?:AS\s+)?'
+    r'(?P<unnest_alias>\w+)\s*\(\s*(?P<unnest_column>\w+)\s*\))',
+    r'(?P<row>\bROW\s*\()',
+    rf'(?P<json_cast>CAST\s*\((?P<json_value>{_ARG})\s+AS\s+JSON\))',
+    r"(?P<interval>INTERVAL\s+'(?P<interval_n>\d+)'\s+(?P<interval_unit>DAY|HOUR|MINUTE|SECOND|MONTH|YEAR))",
+    r"(?P<with_format>WITH\s*\(\s*format\s*=\s*'(?P<format>PARQUET|ORC|AVRO)'\s*\))",
+]))
+_JSON_EXTRACT_CAST_RE = compile_linear(rf'(?i)CAST\s*\(\s*json_extract\s*\({_ARG}\)\s+AS\s+ARRAY')
+# Every match of the patterns above contains one of these (case-folded), so
+# SQL with none of them needs no regex work at all
+_TRINO_FIX_TOKENS = ('varchar', 'varbinary', 'cardinality', 'json', 'array_agg', 'approx_percentile',
+                     'arbitrary', 'date_add', 'date_diff', 'unnest', 'row', 'interval', 'format')
+
+# One statement's text: everything between semicolons
+_STATEMENT_RE = re.compile(r'[^;]+')
+
+# Name of the table or view a statement creates
+_CREATE_NAME_RE = re.compile(r'CREATE\s+(?:TABLE|VIEW)\s+(\w+)', re.IGNORECASE | re.ASCII)
+
+# The AS before the SELECT body of a CREATE ... AS SELECT (AS and SELECT may
+# be on separate lines); the body is sliced from the match end, so the
+# pattern never runs over it
+_AS_SELECT_RE = re.compile(r'\bAS\s+(?=SELECT\b)', re.IGNORECASE | re.ASCII)
+
+# Which EXPLAIN validates a statement, in one case-insensitive sweep: a
+# SELECT (the "select" group) is explained whole, while a match without it
+# found AS SELECT, so only the SELECT of the CREATE ... AS SELECT is
+_STATEMENT_KIND_RE = re.compile(r'(?P<select>\s*SELECT)|.*?AS[ \n]SELECT', re.IGNORECASE | re.DOTALL | re.ASCII)
+
+# Markdown code fences (opening or closing) around an AI_QUERY response
+_MD_FENCE_RE = re.compile(r'^```sql\s*|```\s*$', re.MULTILINE)
+
+
+class ExplainCache:
+    """
+    Statements that passed EXPLAIN in earlier runs, kept in a JSON file so
+    unchanged statements are not validated again; failures are always
+    validated again, since they may be transient. Entries are keyed by a
+    BLAKE2b hash of the warehouse and the (auto-fixed) SQL, so editing a
+    statement (or using another warehouse) validates it again. Call save()
+    to write it back.
+    """
     
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
+    def __init__(self, path: Path, warehouse_id: str):
+        self._path = path
+        self._scope = f"{warehouse_id}\n"
+        try:
+            self._results: Dict[str, Dict] = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self._results = {}
     
-    config = configparser.ConfigParser()
-    config.read(config_path)
+    def key(self, query: str) -> str:
+        """Cache key for a query on this warehouse."""
+        return hashlib.blake2b((self._scope + query).encode('utf-8'), digest_size=16).hexdigest()
     
-    if profile not in config:
-        raise ValueError(f"Profile '{profile}' not found in {config_path}")
+    def get(self, query: str, table_name: str) -> Optional[Dict]:
+        """Return the cached try_original_query result for a query that passed, if any."""
+        result = self._results.get(self.key(query))
+        # Files written before failures stopped being cached may still hold some
+        if result is None or not result.get('original_works'):
+            return None
+        return dict(result, table_name=table_name)
     
-    host = config[profile]['host'].strip()
-    token = config[profile]['token'].strip()
+    def put(self, query: str, result: Dict):
+        """Record a query's try_original_query result if it passed."""
+        if result['original_works']:
+            self._results[self.key(query)] = {k: v for k, v in result.items() if k != 'table_name'}
     
-    return host, token
+    def save(self):
+        """Write the cache file."""
+        self._path.write_text(json.dumps(self._results), encoding='utf-8')
 
 
 def extract_statements(sql_content: str) -> List[Dict[str, str]]:
     """Extract individual SQL statements from a file."""
-    # For files with single SELECT statement, just return it
-    sql_content = sql_content.strip()
-    
-    if not sql_content:
-        return []
+    # Statements are scanned lazily between semicolons; blank ones are skipped
+    # and not numbered
+    statements = (stmt for stmt in (match.group().strip() for match in _STATEMENT_RE.finditer(sql_content))
+                  if stmt)
     
-    # Check if it's a single statement (no semicolons or only one at the end)
-    statements_by_semicolon = [s.strip() for s in sql_content.split(';') if s.strip()]
-    
-    if len(statements_by_semicolon) == 1:
-        # Single statement file
-        result = []
-        stmt = statements_by_semicolon[0]
-        
-        # Extract table/view name if CREATE statement
-        table_match = re.search(r'CREATE\s+(?:TABLE|VIEW)\s+(\w+)', stmt, re.IGNORECASE)
-        if table_match:
-            table_name = table_match.group(1)
-        else:
-            # Standalone SELECT query - use generic name
-            table_name = "query_1"
-        
-        result.append({
-            'table_name': table_name,
-            'sql': stmt
-        })
-        return result
-    
-    # Multiple statements - split properly
     result = []
-    for i, stmt in enumerate(statements_by_semicolon, 1):
-        stmt = stmt.strip()
-        if not stmt:
-            continue
-            
+    for i, stmt in enumerate(statements, 1):
         # Extract table/view name
-        table_match = re.search(r'CREATE\s+(?:TABLE|VIEW)\s+(\w+)', stmt, re.IGNORECASE)
+        table_match = _CREATE_NAME_RE.search(stmt)
         if table_match:
             table_name = table_match.group(1)
         else:
@@ -114,183 +230,111 @@ def extract_statements(sql_content: str) -> List[Dict[str, str]]:
     return result
 
 
-def apply_trino_to_databricks_fixes(sql: str) -> tuple[str, list]:
+def _rewrite_trino(match, fired: Dict[str, str]) -> str:
+    """
+    Replacement for one _TRINO_FIXES_RE match, recording its note in fired.
+    Expressions captured inside a match are fixed too, as the whole-statement
+    passes this scan replaced would have done.
+    """
+    fix = match.lastgroup
+    
+    def fixed(group: str) -> str:
+        return _TRINO_FIXES_RE.sub(lambda inner: _rewrite_trino(inner, fired), match.group(group))
+    
+    if fix == 'date_add':
+        unit = match.group('add_unit').lower()
+        fired.setdefault(f'date_add_{unit}', _TRINO_FIX_NOTES[f'date_add_{unit}'])
+        days_or_months, date_expr = match.group('add_n'), fixed('add_date')
+        if unit == 'day':
+            return f'date_add({date_expr}, {days_or_months})'
+        if unit == 'year':
+            # n years = n*12 months
+            days_or_months = str(int(days_or_months) * 12)
+        return f'add_months({date_expr}, {days_or_months})'
+    
+    if fix == 'with_format':
+        fired.setdefault(fix, _TRINO_FIX_NOTES[fix].format(match.group('format')))
+    else:
+        fired.setdefault(fix, _TRINO_FIX_NOTES[fix])
+    if fix == 'date_diff':
+        return f"datediff({fixed('diff_end')}, {fixed('diff_start')})"
+    if fix == 'unnest':
+        return f"LATERAL VIEW explode({fixed('unnest_array')}) {match.group('unnest_alias')} AS {match.group('unnest_column')}"
+    if fix == 'json_cast':
+        return f"to_json({fixed('json_value')})"
+    if fix == 'interval':
+        return f"INTERVAL {match.group('interval_n')} {match.group('interval_unit')}"
+    return _TRINO_TOKEN_FIXES[fix]
+
+
+@lru_cache(maxsize=1024)
+def apply_trino_to_databricks_fixes(sql: str) -> Tuple[str, Tuple[str, ...]]:
     """
     Apply automatic Trino→Databricks conversions.
-    Returns (fixed_sql, list_of_fixes_applied).
+    Returns (fixed_sql, fixes_applied). Memoized, since dumps repeat
+    statements across files; fixes_applied is a tuple so it can be shared.
     """
-    fixes_applied = []
-    fixed_sql = sql
-    
-    # Fix 1: VARCHAR/VARCHAR(n) → STRING
-    if re.search(r'\bVARCHAR(?:\(\d+\))?\b', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\bVARCHAR(?:\(\d+\))?\b', 'STRING', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted VARCHAR to STRING")
-    
-    # Fix 2: VARBINARY → BINARY
-    if re.search(r'\bVARBINARY\b', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\bVARBINARY\b', 'BINARY', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted VARBINARY to BINARY")
-    
-    # Fix 3: cardinality(array) → size(array)
-    if re.search(r'\bcardinality\s*\(', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\bcardinality\s*\(', 'size(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted cardinality() to size()")
-    
-    # Fix 4: json_extract_scalar() → get_json_object()
-    if re.search(r'\bjson_extract_scalar\s*\(', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\bjson_extract_scalar\s*\(', 'get_json_object(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted json_extract_scalar() to get_json_object()")
-    
-    # Fix 5: array_agg(DISTINCT x) → collect_set(x)
-    if re.search(r'\barray_agg\s*\(\s*DISTINCT\s+', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\barray_agg\s*\(\s*DISTINCT\s+', 'collect_set(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted array_agg(DISTINCT) to collect_set()")
-    
-    # Fix 6: array_agg(x) → collect_list(x)
-    if re.search(r'\barray_agg\s*\(', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\barray_agg\s*\(', 'collect_list(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted array_agg() to collect_list()")
-    
-    # Fix 7: approx_percentile() → percentile_approx()
-    if re.search(r'\bapprox_percentile\s*\(', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\bapprox_percentile\s*\(', 'percentile_approx(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted approx_percentile() to percentile_approx()")
-    
-    # Fix 8: arbitrary() → first()
-    if re.search(r'\barbitrary\s*\(', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\barbitrary\s*\(', 'first(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted arbitrary() to first()")
-    
-    # Fix 9: date_trunc('unit', date) → date_trunc('unit', date)
-    # Compatible! But Spark uses different syntax sometimes
-    # Trino: date_trunc('month', date_col)
-    # Spark: date_trunc('MONTH', date_col) or trunc(date_col, 'MONTH')
-    # Keep as-is, Spark supports date_trunc
-    
-    # Fix 10: date_add('unit', value, date) → date_add(date, value) or add_months()
-    # Trino: date_add('day', 7, date_col) or date_add('month', 1, date_col)
-    # Spark: date_add(date_col, 7) for days, add_months(date_col, 1) for months
-    
-    # Handle date_add for days
-    day_add_pattern = r"date_add\s*\(\s*'day'\s*,\s*(-?\d+)\s*,\s*([^)]+)\)"
-    if re.search(day_add_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(day_add_pattern, r'date_add(\2, \1)', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted date_add('day', n, date) to date_add(date, n)")
-    
-    # Handle date_add for months
-    month_add_pattern = r"date_add\s*\(\s*'month'\s*,\s*(-?\d+)\s*,\s*([^)]+)\)"
-    if re.search(month_add_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(month_add_pattern, r'add_months(\2, \1)', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted date_add('month', n, date) to add_months(date, n)")
-    
-    # Handle date_add for years
-    year_add_pattern = r"date_add\s*\(\s*'year'\s*,\s*(-?\d+)\s*,\s*([^)]+)\)"
-    if re.search(year_add_pattern, fixed_sql, flags=re.IGNORECASE):
-        # Convert years to months (n years = n*12 months)
-        def year_to_months(match):
-            years = int(match.group(1))
-            date_expr = match.group(2)
-            months = years * 12
-            return f'add_months({date_expr}, {months})'
-        fixed_sql = re.sub(year_add_pattern, year_to_months, fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted date_add('year', n, date) to add_months(date, n*12)")
-    
-    # Fix 11: date_diff('unit', date1, date2) → datediff(date2, date1) for days
-    # Trino: date_diff('day', start_date, end_date)
-    # Spark: datediff(end_date, start_date)
-    date_diff_pattern = r"date_diff\s*\(\s*'day'\s*,\s*([^,]+),\s*([^)]+)\)"
-    if re.search(date_diff_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(date_diff_pattern, r'datediff(\2, \1)', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted date_diff('day', start, end) to datediff(end, start)")
-    
-    # Fix 12: UNNEST with CROSS JOIN → LATERAL VIEW explode()
-    # Trino: FROM table t CROSS JOIN UNNEST(t.array_col) AS u(elem)
-    # Spark: FROM table t LATERAL VIEW explode(t.array_col) table_alias AS elem
-    
-    # Pattern 1: CROSS JOIN UNNEST(array) AS alias(column)
-    unnest_pattern = r'CROSS\s+JOIN\s+UNNEST\s*\(\s*([^)]+)\s*\)\s+(?:AS\s+)?(\w+)\s*\(\s*(\w+)\s*\)'
-    if re.search(unnest_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(
-            unnest_pattern,
-            r'LATERAL VIEW explode(\1) \2 AS \3',
-            fixed_sql,
-            flags=re.IGNORECASE
-        )
-        fixes_applied.append("Converted CROSS JOIN UNNEST() to LATERAL VIEW explode()")
-    
-    # Fix 13: ROW(...) → STRUCT(...)
-    if re.search(r'\bROW\s*\(', fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(r'\bROW\s*\(', 'STRUCT(', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted ROW() to STRUCT()")
-    
-    # Fix 14: CAST(x AS JSON) → to_json(x)
-    json_cast_pattern = r'CAST\s*\(([^)]+)\s+AS\s+JSON\)'
-    if re.search(json_cast_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(json_cast_pattern, r'to_json(\1)', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted CAST(x AS JSON) to to_json(x)")
-    
-    # Fix 15: INTERVAL 'n' UNIT → INTERVAL n UNIT
-    interval_pattern = r"INTERVAL\s+'(\d+)'\s+(DAY|HOUR|MINUTE|SECOND|MONTH|YEAR)"
-    if re.search(interval_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixed_sql = re.sub(interval_pattern, r'INTERVAL \1 \2', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append("Converted INTERVAL 'n' UNIT to INTERVAL n UNIT")
+    folded = sql.casefold()
+    if not any(token in folded for token in _TRINO_FIX_TOKENS):
+        return sql, ()
     
-    # Fix 16: element_at() is compatible between Trino and Spark!
+    fired: Dict[str, str] = {}
+    fixed_sql = _TRINO_FIXES_RE.sub(lambda match: _rewrite_trino(match, fired), sql)
     
     # Fix 17: json_extract() with CAST → from_json() - complex, add TODO
-    json_extract_pattern = r'CAST\s*\(\s*json_extract\s*\([^)]+\)\s+AS\s+ARRAY'
-    if re.search(json_extract_pattern, fixed_sql, flags=re.IGNORECASE):
-        fixes_applied.append("TODO: Review json_extract() with CAST - may need from_json() with schema")
+    if _JSON_EXTRACT_CAST_RE.search(fixed_sql):
+        fired['json_extract_cast'] = _TRINO_FIX_NOTES['json_extract_cast']
     
-    # Fix 18: WITH (format = 'X') → USING format
-    with_format_pattern = r"WITH\s*\(\s*format\s*=\s*'(PARQUET|ORC|AVRO)'\s*\)"
-    if re.search(with_format_pattern, fixed_sql, flags=re.IGNORECASE):
-        format_type = re.search(with_format_pattern, fixed_sql, flags=re.IGNORECASE).group(1)
-        fixed_sql = re.sub(with_format_pattern, 'USING ICEBERG', fixed_sql, flags=re.IGNORECASE)
-        fixes_applied.append(f"Converted WITH (format = '{format_type}') to USING ICEBERG")
-    
-    return fixed_sql, fixes_applied
+    return fixed_sql, tuple(fired[fix] for fix in _TRINO_FIX_NOTES if fix in fired)
 
 
-def try_original_query(connection: Connection, query: str, table_name: str) -> Dict:
+def explain_statement(query: str) -> Optional[str]:
     """
-    Try to validate the Trino query after auto-fixes with EXPLAIN.
-    Returns success/failure status.
+    The EXPLAIN that validates a query, or None if a CREATE ... AS SELECT
+    has no SELECT to explain.
     """
-    result = {
+    kind = _STATEMENT_KIND_RE.match(query)
+    # For CREATE statements, extract AS SELECT portion
+    if kind and not kind.group('select'):
+        match = _AS_SELECT_RE.search(query)
+        if not match:
+            return None
+        # The body starts at SELECT, so only its end needs stripping
+        return f"EXPLAIN {query[match.end():].rstrip(';').rstrip()}"
+    # For SELECT statements (or anything else), explain the whole thing
+    return f"EXPLAIN {query.rstrip(';')}"
+
+
+def validation_result(table_name: str) -> Dict:
+    """A try_original_query result, before the query is validated."""
+    return {
         'table_name': table_name,
         'original_works': False,
         'error': None,
         'explain_output': None
     }
+
+
+def record_explain(result: Dict, explain_results: list):
+    """Mark a query as valid and keep the start of its EXPLAIN plan."""
+    result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:5]])
+    result['original_works'] = True
+
+
+def try_original_query(connection: Connection, query: str, table_name: str) -> Dict:
+    """
+    Try to validate the Trino query after auto-fixes with EXPLAIN.
+    Returns success/failure status.
+    """
+    result = validation_result(table_name)
+    explain_query = explain_statement(query)
+    if explain_query is None:
+        return result
     
     try:
         with connection.cursor() as cursor:
-            # For SELECT statements, try EXPLAIN directly
-            if query.strip().upper().startswith('SELECT'):
-                explain_query = f"EXPLAIN {query.rstrip(';')}"
-                cursor.execute(explain_query)
-                explain_results = cursor.fetchall()
-                result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:5]])
-                result['original_works'] = True
-            # For CREATE statements, extract AS SELECT portion
-            elif 'AS SELECT' in query.upper() or 'AS\nSELECT' in query.upper():
-                match = re.search(r'\bAS\s+(SELECT\b.*)', query, flags=re.IGNORECASE | re.DOTALL)
-                if match:
-                    select_statement = match.group(1).rstrip(';').strip()
-                    explain_query = f"EXPLAIN {select_statement}"
-                    cursor.execute(explain_query)
-                    explain_results = cursor.fetchall()
-                    result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:5]])
-                    result['original_works'] = True
-            else:
-                # Try to explain the whole thing
-                explain_query = f"EXPLAIN {query.rstrip(';')}"
-                cursor.execute(explain_query)
-                explain_results = cursor.fetchall()
-                result['explain_output'] = '\n'.join([str(row[0]) for row in explain_results[:5]])
-                result['original_works'] = True
+            cursor.execute(explain_query)
+            record_explain(result, cursor.fetchall())
                 
     except Exception as e:
         result['error'] = str(e)
@@ -299,30 +343,60 @@ def try_original_query(connection: Connection, query: str, table_name: str) -> D
     return result
 
 
-def convert_with_ai(connection: Connection, query: str, table_name: str, error_msg: str) -> Dict:
+def try_original_queries(connection: Connection, queries: List[Tuple[str, str]],
+                         batch_size: int = 16, cache: Optional[ExplainCache] = None) -> List[Dict]:
     """
-    Use AI_QUERY to convert Trino SQL to Databricks SQL.
+    Validate many (query, table_name) pairs, like try_original_query.
+    The EXPLAINs of each batch are all submitted, each on its own cursor,
+    before any of them is awaited, so a batch costs about one round trip.
+    Queries found in the cache are not validated again; those that pass are added.
     """
-    result = {
-        'converted_sql': None,
-        'conversion_error': None,
-        'validation_works': False,
-        'validation_error': None
-    }
-    
-    # Escape single quotes for AI_QUERY
-    escaped_query = query.replace("'", "''")
+    results: List[Dict] = []
+    for start in range(0, len(queries), batch_size):
+        checks = []
+        for query, table_name in queries[start:start + batch_size]:
+            cached = cache.get(query, table_name) if cache else None
+            if cached is not None:
+                checks.append((cached, None, query))
+            else:
+                checks.append((validation_result(table_name), explain_statement(query), query))
+        # Statements still to EXPLAIN, each with its own cursor
+        pending = [(result, explain_query, connection.cursor())
+                   for result, explain_query, _ in checks if explain_query is not None]
+        try:
+            errors = [submit_query(cursor, explain_query) for _, explain_query, cursor in pending]
+            
+            for (result, _, cursor), error in zip(pending, errors):
+                if error is None:
+                    try:
+                        record_explain(result, collect_query(cursor))
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    result['error'] = str(error)
+                    result['original_works'] = False
+        finally:
+            for _, _, cursor in pending:
+                cursor.close()
+        
+        if cache:
+            for result, explain_query, query in checks:
+                if explain_query is not None:
+                    cache.put(query, result)
+        results.extend(result for result, _, _ in checks)
     
+    return results
+
+
+def conversion_prompt(query: str, error_msg: Optional[str]) -> str:
+    """Build the AI_QUERY prompt for a Trino statement that failed with error_msg."""
     # Truncate if too long
-    if len(escaped_query) > 3000:
-        escaped_query = escaped_query[:3000]
+    if len(query) > 3000:
+        query = query[:3000]
     
-    try:
-        with connection.cursor() as cursor:
-            # Use AI_QUERY to convert
-            conversion_prompt = f"""You are a SQL converter. Convert this Trino SQL to Databricks Spark SQL.
+    return f"""You are a SQL converter. Convert this Trino SQL to Databricks Spark SQL.
 
-ERROR: {error_msg[:200]}
+ERROR: {(error_msg or '')[:200]}
 
 CRITICAL RULES:
 - Return ONLY executable SQL code
@@ -339,57 +413,87 @@ CRITICAL RULES:
   * ROW() → STRUCT()
 
 INPUT TRINO SQL:
-{escaped_query}
+{query}
 
 OUTPUT (SQL only):"""
 
-            # Escape the entire prompt for SQL string
-            escaped_prompt = conversion_prompt.replace("'", "''")
 
-            ai_query = f"""
-            SELECT AI_QUERY(
+def request_conversions(connection: Connection, requests: List[Tuple[str, Optional[str]]],
+                        batch_size: int = 16) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Ask AI_QUERY to convert Trino statements, each given with the error it
+    failed with, in one round trip per batch_size statements (one row per
+    statement), which keeps each query within the bound-parameter cap.
+    Returns (converted_sql, error) per statement - exactly one of them is None.
+    """
+    if not requests:
+        return []
+    if len(requests) > batch_size:
+        return [conversion for start in range(0, len(requests), batch_size)
+                for conversion in request_conversions(connection, requests[start:start + batch_size], batch_size)]
+    
+    # The prompts are bound parameters, so they need no quote escaping
+    rows = ', '.join(f'({i}, :prompt{i})' for i in range(len(requests)))
+    ai_query = f"""
+            SELECT idx, AI_QUERY(
                 'databricks-claude-sonnet-4-5',
-                '{escaped_prompt}'
+                prompt
             ) as converted_sql
+            FROM VALUES {rows} AS t(idx, prompt)
             """
-            
-            cursor.execute(ai_query)
-            ai_result = cursor.fetchone()
-            
-            if ai_result and ai_result[0]:
-                converted_sql = ai_result[0]
-                # Clean up the response (remove markdown if present)
-                converted_sql = re.sub(r'^```sql\s*', '', converted_sql, flags=re.MULTILINE)
-                converted_sql = re.sub(r'```\s*$', '', converted_sql, flags=re.MULTILINE)
-                result['converted_sql'] = converted_sql.strip()
-            else:
-                result['conversion_error'] = "AI_QUERY returned empty result"
-                return result
-                
+    parameters = {f'prompt{i}': conversion_prompt(query, error_msg)
+                  for i, (query, error_msg) in enumerate(requests)}
+    
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(ai_query, parameters)
+            converted = {idx: converted_sql for idx, converted_sql in cursor.fetchall()}
     except Exception as e:
-        result['conversion_error'] = f"AI_QUERY conversion failed: {str(e)}"
+        if len(requests) > 1:
+            # One failing conversion fails the whole batch; retry them one by one
+            return [conversion for request in requests
+                    for conversion in request_conversions(connection, [request])]
+        return [(None, f"AI_QUERY conversion failed: {str(e)}")]
+    
+    conversions: List[Tuple[Optional[str], Optional[str]]] = []
+    for i in range(len(requests)):
+        converted_sql = converted.get(i)
+        if converted_sql:
+            # Clean up the response (remove markdown if present)
+            conversions.append((_MD_FENCE_RE.sub('', converted_sql).strip(), None))
+        else:
+            conversions.append((None, "AI_QUERY returned empty result"))
+    return conversions
+
+
+def convert_with_ai(connection: Connection, query: str, table_name: str, error_msg: str,
+                    conversion: Optional[Tuple[Optional[str], Optional[str]]] = None) -> Dict:
+    """
+    Use AI_QUERY to convert Trino SQL to Databricks SQL, then validate it.
+    A conversion already requested (see request_conversions) is only validated.
+    """
+    result = {
+        'converted_sql': None,
+        'conversion_error': None,
+        'validation_works': False,
+        'validation_error': None
+    }
+    
+    converted_sql, conversion_error = conversion or request_conversions(connection, [(query, error_msg)])[0]
+    if conversion_error:
+        result['conversion_error'] = conversion_error
         return result
+    result['converted_sql'] = converted_sql
     
     # Validate the converted SQL with EXPLAIN
+    explain_query = explain_statement(converted_sql)
+    if explain_query is None:
+        return result
+    
     try:
         with connection.cursor() as cursor:
-            converted_sql = result['converted_sql']
-            
-            if converted_sql.strip().upper().startswith('SELECT'):
-                explain_query = f"EXPLAIN {converted_sql.rstrip(';')}"
-                cursor.execute(explain_query)
-                result['validation_works'] = True
-            elif 'AS SELECT' in converted_sql.upper() or 'AS\nSELECT' in converted_sql.upper():
-                match = re.search(r'\bAS\s+(SELECT\b.*)', converted_sql, flags=re.IGNORECASE | re.DOTALL)
-                if match:
-                    select_statement = match.group(1).rstrip(';').strip()
-                    explain_query = f"EXPLAIN {select_statement}"
-                    cursor.execute(explain_query)
-                    result['validation_works'] = True
-            else:
-                explain_query = f"EXPLAIN {converted_sql.rstrip(';')}"
-                cursor.execute(explain_query)
-                result['validation_works'] = True
+            cursor.execute(explain_query)
+            result['validation_works'] = True
                 
     except Exception as validation_error:
         result['validation_error'] = f"Converted SQL validation failed: {str(validation_error)}"
@@ -398,9 +502,22 @@ OUTPUT (SQL only):"""
     return result
 
 
-def process_query(connection: Connection, query: str, table_name: str) -> Dict:
+def fix_and_validate(connection: Connection, query: str, table_name: str) -> Tuple[str, Tuple[str, ...], Dict]:
+    """
+    Apply the auto-fixes to a query and validate the fixed SQL.
+    Returns (fixed_sql, fixes_applied, validation_result).
+    """
+    fixed_sql, fixes_applied = apply_trino_to_databricks_fixes(query)
+    return fixed_sql, fixes_applied, try_original_query(connection, fixed_sql, table_name)
+
+
+def process_query(connection: Connection, query: str, table_name: str,
+                  checked: Optional[Tuple[str, Tuple[str, ...], Dict]] = None,
+                  conversion: Optional[Tuple[Optional[str], Optional[str]]] = None) -> Dict:
     """
     Process a single query: try auto-fixes, convert if needed.
+    The fix and validation (see fix_and_validate) and the AI conversion (see
+    request_conversions) are only done here when not passed in.
     """
     result = {
         'table_name': table_name,
@@ -412,17 +529,15 @@ def process_query(connection: Connection, query: str, table_name: str) -> Dict:
     
     print(f"  {Colors.YELLOW}Step 1: Applying auto-fixes...{Colors.RESET}", end=" ")
     
-    # Apply automatic fixes
-    fixed_sql, fixes_applied = apply_trino_to_databricks_fixes(query)
+    # Apply automatic fixes, and test the fixed SQL
+    fixed_sql, fixes_applied, validation_result = checked or fix_and_validate(connection, query, table_name)
     
     if fixes_applied:
         print(f"{Colors.GREEN}✓ Applied {len(fixes_applied)} fix(es){Colors.RESET}")
     else:
         print(f"{Colors.CYAN}✓ No fixes needed{Colors.RESET}")
     
-    # Test the fixed SQL
     print(f"  {Colors.YELLOW}Step 2: Validating with EXPLAIN...{Colors.RESET}", end=" ")
-    validation_result = try_original_query(connection, fixed_sql, table_name)
     
     if validation_result['original_works']:
         print(f"{Colors.GREEN}✓ Valid!{Colors.RESET}")
@@ -441,7 +556,7 @@ def process_query(connection: Connection, query: str, table_name: str) -> Dict:
     # Try AI conversion
     print(f"  {Colors.YELLOW}Step 3: Converting with AI_QUERY...{Colors.RESET}", end=" ")
     
-    conversion_result = convert_with_ai(connection, query, table_name, validation_result['error'])
+    conversion_result = convert_with_ai(connection, query, table_name, validation_result['error'], conversion)
     
     if conversion_result['conversion_error']:
         print(f"{Colors.RED}✗ Conversion failed{Colors.RESET}")
@@ -467,50 +582,81 @@ def process_query(connection: Connection, query: str, table_name: str) -> Dict:
     return result
 
 
-def process_trino_file(connection: Connection, file_path: Path, output_dir: Path) -> List[Dict]:
+# Output files are written through a large buffer, so the many small writes
+# reach the OS in a few big chunks
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def format_output_block(result: Dict, file_name: str) -> str:
+    """Format one processed statement for the *_databricks.sql output file."""
+    notes = ''.join(f"-- Note: {note}\n" for note in result['conversion_notes'])
+    return (f"-- Table/Query: {result['table_name']}\n"
+            f"-- Original file: {file_name}\n"
+            f"-- Status: {result['status'].upper().replace('_', ' ')}\n"
+            f"{notes}\n"
+            f"{result['final_sql']}\n\n"
+            f"{'-' * 80}\n")
+
+
+def process_trino_file(connection: Connection, file_path: Path, output_dir: Path,
+                       explain_cache: Optional[ExplainCache] = None) -> List[Dict]:
     """
     Process a single Trino SQL file: try auto-fixes, convert what's needed.
+    Statements that passed in explain_cache are not EXPLAINed again.
     """
     print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}")
     print(f"{Colors.CYAN}{Colors.BOLD}Processing: {file_path.name}{Colors.RESET}")
     print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
     
-    with open(file_path, 'r') as f:
-        trino_content = f.read()
+    # Decoded in one step, without text mode's incremental newline
+    # translation; only files that have \r newlines are translated
+    trino_content = file_path.read_bytes().decode('utf-8')
+    if '\r' in trino_content:
+        trino_content = trino_content.replace('\r\n', '\n').replace('\r', '\n')
     
     statements = extract_statements(trino_content)
     results = []
-    output_statements = []
+    # Opened when the first statement is ready, then written to as each one is
+    output_file = output_dir / f"{file_path.stem}_databricks.sql"
+    output = None
+    
+    # Fix and validate every statement first, pipelining the EXPLAINs, so
+    # those that still fail are all converted in a single AI_QUERY round trip
+    fixes = [apply_trino_to_databricks_fixes(stmt_info['sql']) for stmt_info in statements]
+    validations = try_original_queries(
+        connection, [(fixed_sql, stmt_info['table_name']) for (fixed_sql, _), stmt_info in zip(fixes, statements)],
+        cache=explain_cache)
+    checks = [(fixed_sql, fixes_applied, validation)
+              for (fixed_sql, fixes_applied), validation in zip(fixes, validations)]
+    failing = [i for i, (_, _, validation_result) in enumerate(checks)
+               if not validation_result['original_works']]
+    conversions = dict(zip(failing, request_conversions(
+        connection, [(statements[i]['sql'], checks[i][2]['error']) for i in failing])))
     
-    for i, stmt_info in enumerate(statements, 1):
-        table_name = stmt_info['table_name']
-        query = stmt_info['sql']
-        
-        print(f"{Colors.YELLOW}{Colors.BOLD}[{i}/{len(statements)}] Processing: {table_name}{Colors.RESET}")
-        result = process_query(connection, query, table_name)
-        result['file'] = file_path.stem
-        results.append(result)
-        
-        # Add to output
-        if result['final_sql']:
-            output_statements.append(f"-- Table/Query: {table_name}")
-            output_statements.append(f"-- Original file: {file_path.name}")
-            output_statements.append(f"-- Status: {result['status'].upper().replace('_', ' ')}")
-            for note in result['conversion_notes']:
-                output_statements.append(f"-- Note: {note}")
-            output_statements.append("")
-            output_statements.append(result['final_sql'])
-            output_statements.append("")
-            output_statements.append("-" * 80)
-            output_statements.append("")
-        
-        print()
+    try:
+        for i, (stmt_info, checked) in enumerate(zip(statements, checks), 1):
+            table_name = stmt_info['table_name']
+            query = stmt_info['sql']
+            
+            print(f"{Colors.YELLOW}{Colors.BOLD}[{i}/{len(statements)}] Processing: {table_name}{Colors.RESET}")
+            result = process_query(connection, query, table_name, checked, conversions.get(i - 1))
+            result['file'] = file_path.stem
+            results.append(result)
+            
+            # Add to output, the blocks separated by a blank line
+            if result['final_sql']:
+                if output is None:
+                    output = open(output_file, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+                else:
+                    output.write('\n')
+                output.write(format_output_block(result, file_path.name))
+            
+            print()
+    finally:
+        if output is not None:
+            output.close()
     
-    # Save to file
-    if output_statements:
-        output_file = output_dir / f"{file_path.stem}_databricks.sql"
-        with open(output_file, 'w') as f:
-            f.write('\n'.join(output_statements))
+    if output is not None:
         print(f"{Colors.GREEN}✓ Saved Databricks SQL to: {output_file.name}{Colors.RESET}")
     
     return results
@@ -524,10 +670,12 @@ def print_summary(all_results: List[Dict]):
         print(f"\n{Colors.YELLOW}No queries were processed. Check that SQL files contain valid statements.{Colors.RESET}\n")
         return
     
-    unchanged = sum(1 for r in all_results if r['status'] == 'unchanged')
-    auto_fixed = sum(1 for r in all_results if r['status'] == 'auto_fixed')
-    ai_converted = sum(1 for r in all_results if r['status'] == 'ai_converted')
-    failed = sum(1 for r in all_results if r['status'] == 'failed')
+    # All status counts in one pass
+    counts = Counter(r['status'] for r in all_results)
+    unchanged = counts['unchanged']
+    auto_fixed = counts['auto_fixed']
+    ai_converted = counts['ai_converted']
+    failed = counts['failed']
     
     print(f"\n{Colors.MAGENTA}{Colors.BOLD}{'='*80}{Colors.RESET}")
     print(f"{Colors.MAGENTA}{Colors.BOLD}TRINO → DATABRICKS CONVERSION SUMMARY{Colors.RESET}")
@@ -581,6 +729,8 @@ def main():
     # Configuration
     DATABRICKS_PROFILE = os.getenv('DATABRICKS_PROFILE', 'fe')
     WAREHOUSE_ID = os.getenv('DATABRICKS_WAREHOUSE_ID')
+    # Skip EXPLAINs of statements that passed in an earlier run; TRINO_EXPLAIN_CACHE=0 validates everything
+    USE_EXPLAIN_CACHE = os.getenv('TRINO_EXPLAIN_CACHE', '1') == '1'
     
     # Get script directory and set up paths
     script_dir = Path(__file__).parent.parent
@@ -637,13 +787,17 @@ def main():
         print(f"{Colors.RED}✗ Failed to connect: {e}{Colors.RESET}")
         return
     
+    explain_cache = ExplainCache(output_dir / '.explain_cache.json', WAREHOUSE_ID) if USE_EXPLAIN_CACHE else None
+    
     # Process all Trino SQL files
     all_results = []
     try:
         for trino_file in trino_files:
-            file_results = process_trino_file(connection, trino_file, output_dir)
+            file_results = process_trino_file(connection, trino_file, output_dir, explain_cache)
             all_results.extend(file_results)
     finally:
+        if explain_cache:
+            explain_cache.save()
         if connection:
             connection.close()
             print(f"\n{Colors.YELLOW}Connection closed{Colors.RESET}")